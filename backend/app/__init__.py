@@ -1,4 +1,4 @@
-from flask import Flask
+from flask import Flask, jsonify
 from flask_sqlalchemy import SQLAlchemy
 from flask_jwt_extended import JWTManager
 from flask_cors import CORS
@@ -6,6 +6,16 @@ from flask_cors import CORS
 db = SQLAlchemy()
 jwt = JWTManager()
 
+@jwt.token_in_blocklist_loader
+def token_revogado(cabecalho, dados):
+    """Consulta a lista de revogação em memória; o banco só é lido para buscar revogações novas"""
+    from app.utils.revogacao import lista_revogacao
+    return lista_revogacao.contem(dados['jti'])
+
+@jwt.revoked_token_loader
+def token_revogado_resposta(cabecalho, dados):
+    return jsonify({'error': 'Token revogado; faça login novamente'}), 401
+
 def create_app():
     app = Flask(__name__)
     app.config.from_pyfile('../config.py')  # Você pode trocar isso por configurações diretas
@@ -21,6 +31,7 @@ def create_app():
     from app.routes.dashboard import dashboard_bp
     from app.routes.despesas import despesas_bp
     from app.routes.auth import auth_bp
+    from app.routes.busca import busca_bp
 
     app.register_blueprint(usuarios_bp, url_prefix='/usuarios')
     app.register_blueprint(aportes_bp, url_prefix='/aportes')
@@ -28,5 +39,6 @@ def create_app():
     app.register_blueprint(dashboard_bp, url_prefix='/dashboard')
     app.register_blueprint(despesas_bp, url_prefix='/despesas')
     app.register_blueprint(auth_bp, url_prefix='/auth')
+    app.register_blueprint(busca_bp, url_prefix='/busca')
 
     return app
@@ -4,6 +4,15 @@ from app.models.categoria import Categoria
 from app.models.cartao import Cartao
 from app.models.despesa import Despesa
 from app.models.aporte import Aporte
+from app.models.total_mensal import TotalMensal
+from app.models.lancamento_saldo import LancamentoSaldo
+from app.models.versao_tabela import VersaoTabela
+from app.models.fatura import Fatura
+from app.models.saldo_cartao import SaldoCartao
+from app.models.token_revogado import TokenRevogado
 
 # Importar todos os modelos para que sejam reconhecidos pelo SQLAlchemy
-__all__ = ['Usuario', 'Categoria', 'Cartao', 'Despesa', 'Aporte']
+__all__ = ['Usuario', 'Categoria', 'Cartao', 'Despesa', 'Aporte', 'TotalMensal', 'LancamentoSaldo', 'VersaoTabela', 'Fatura', 'SaldoCartao', 'TokenRevogado']
+
+# Registrar eventos de sessão que mantêm as tabelas derivadas atualizadas
+from app.utils import totais_mensais, saldos, versoes, busca, faturas, limites_cartoes  # noqa: E402,F401
@@ -11,6 +11,10 @@ class Aporte(db.Model):
     observacao = db.Column(db.String(255))
     data_criacao = db.Column(db.DateTime, default=datetime.utcnow)
     
+    __table_args__ = (
+        db.Index('ix_aportes_usuario_data', 'usuario_id', 'data'),
+    )
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -1,5 +1,6 @@
 from app import db
-from datetime import datetime
+from datetime import datetime, time
+from app.utils.calendario_faturas import calendario_cartao
 
 class Cartao(db.Model):
     __tablename__ = 'cartoes'
@@ -24,40 +25,19 @@ class Cartao(db.Model):
             'dia_fechamento': self.dia_fechamento,
             'dia_vencimento': self.dia_vencimento,
             'limite': self.limite,
+            'saldo_aberto': self.saldo.saldo_aberto if self.saldo else 0.0,
+            'limite_disponivel': (self.limite or 0) - (self.saldo.saldo_aberto if self.saldo else 0.0),
             'usuario_id': self.usuario_id,
             'usuario': self.usuario.to_dict() if self.usuario else None,
             'data_criacao': self.data_criacao.isoformat() if self.data_criacao else None
         }
     
     def proxima_fatura(self):
-        hoje = datetime.now()
-        ano = hoje.year
-        mes = hoje.month
-        
-        # Determinar data de fechamento
-        if hoje.day > self.dia_fechamento:
-            # Se já passou do dia de fechamento, a próxima fatura fecha no próximo mês
-            mes += 1
-            if mes > 12:
-                mes = 1
-                ano += 1
-        
-        data_fechamento = datetime(ano, mes, self.dia_fechamento)
-        
-        # Determinar data de vencimento
-        mes_vencimento = mes
-        ano_vencimento = ano
-        if self.dia_vencimento < self.dia_fechamento:
-            # Se o vencimento é antes do fechamento, o vencimento é no mês seguinte
-            mes_vencimento += 1
-            if mes_vencimento > 12:
-                mes_vencimento = 1
-                ano_vencimento += 1
-        
-        data_vencimento = datetime(ano_vencimento, mes_vencimento, self.dia_vencimento)
+        # Fatura em aberto hoje: a deste mês, ou a do próximo se já passou do fechamento
+        ciclo = calendario_cartao(self).ciclo_da_data(datetime.now().date())
         
         return {
-            'fechamento': data_fechamento.isoformat(),
-            'vencimento': data_vencimento.isoformat(),
+            'fechamento': datetime.combine(ciclo.fechamento, time()).isoformat(),
+            'vencimento': datetime.combine(ciclo.vencimento, time()).isoformat(),
             'valor_previsto': 0.0  # Será calculado com base nas despesas
         }
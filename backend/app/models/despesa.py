@@ -23,6 +23,15 @@ class Despesa(db.Model):
     despesa_pai_id = db.Column(db.Integer, db.ForeignKey('despesas.id'))  # Para recorrências/parcelas
     data_criacao = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Índices compostos nos caminhos de acesso das rotas (fatura por cartão, vencimentos, categorias)
+    __table_args__ = (
+        db.Index('ix_despesas_cartao_data_compra', 'cartao_id', 'data_compra'),
+        db.Index('ix_despesas_status_data_vencimento', 'status', 'data_vencimento'),
+        db.Index('ix_despesas_categoria_data_vencimento', 'categoria_id', 'data_vencimento'),
+        db.Index('ix_despesas_data_compra_id', 'data_compra', 'id'),
+        db.Index('ix_despesas_despesa_pai_id', 'despesa_pai_id'),
+    )
+    
     # Relacionamentos
     despesas_filhas = db.relationship('Despesa', backref=db.backref('despesa_pai', remote_side=[id]), lazy=True)
     
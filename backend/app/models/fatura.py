@@ -0,0 +1,51 @@
+from app import db
+from datetime import datetime
+from sqlalchemy.orm import foreign
+from app.models.despesa import Despesa
+
+class Fatura(db.Model):
+    """Fotografia de um ciclo de faturamento já fechado; o ciclo em aberto é sempre calculado na hora"""
+    __tablename__ = 'faturas'
+
+    id = db.Column(db.Integer, primary_key=True)
+    cartao_id = db.Column(db.Integer, db.ForeignKey('cartoes.id'), nullable=False)
+    ano = db.Column(db.Integer, nullable=False)
+    mes = db.Column(db.Integer, nullable=False)  # Mês de fechamento
+    data_inicio = db.Column(db.Date, nullable=False)  # Fechamento anterior (exclusivo)
+    data_fechamento = db.Column(db.Date, nullable=False)
+    data_vencimento = db.Column(db.Date, nullable=False)
+    valor_total = db.Column(db.Float, nullable=False, default=0.0)
+    quantidade_despesas = db.Column(db.Integer, nullable=False, default=0)
+    status = db.Column(db.String(20), nullable=False, default='fechada')  # fechada, paga
+    data_criacao = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('cartao_id', 'ano', 'mes', name='uq_faturas_cartao_ano_mes'),
+        db.Index('ix_faturas_cartao_fechamento', 'cartao_id', 'data_fechamento'),
+    )
+
+    # Itens da fatura: despesas do cartão com data_compra em (data_inicio, data_fechamento]
+    despesas = db.relationship(
+        Despesa,
+        primaryjoin=db.and_(
+            foreign(Despesa.cartao_id) == cartao_id,
+            foreign(Despesa.data_compra) > data_inicio,
+            foreign(Despesa.data_compra) <= data_fechamento
+        ),
+        viewonly=True,
+        order_by=Despesa.data_compra
+    )
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'cartao_id': self.cartao_id,
+            'ano': self.ano,
+            'mes': self.mes,
+            'data_inicio': self.data_inicio.isoformat() if self.data_inicio else None,
+            'data_fechamento': self.data_fechamento.isoformat() if self.data_fechamento else None,
+            'data_vencimento': self.data_vencimento.isoformat() if self.data_vencimento else None,
+            'valor_total': self.valor_total,
+            'quantidade_despesas': self.quantidade_despesas,
+            'status': self.status
+        }
@@ -0,0 +1,31 @@
+from app import db
+from datetime import datetime
+
+class LancamentoSaldo(db.Model):
+    __tablename__ = 'lancamentos_saldo'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    # Investidor do lançamento; nulo para o fluxo comum de despesas divididas pagas
+    usuario_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'))
+    data = db.Column(db.Date, nullable=False)
+    valor = db.Column(db.Float, nullable=False)  # Positivo para aportes, negativo para despesas
+    saldo_acumulado = db.Column(db.Float, nullable=False)  # Soma dos lançamentos do fluxo até (data, id)
+    origem = db.Column(db.String(20), nullable=False)  # aporte ou despesa
+    referencia_id = db.Column(db.Integer)  # id do aporte ou da despesa que gerou o lançamento
+    data_criacao = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_lancamentos_saldo_usuario_data', 'usuario_id', 'data', 'id'),
+    )
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'usuario_id': self.usuario_id,
+            'data': self.data.isoformat() if self.data else None,
+            'valor': self.valor,
+            'saldo_acumulado': self.saldo_acumulado,
+            'origem': self.origem,
+            'referencia_id': self.referencia_id,
+            'data_criacao': self.data_criacao.isoformat() if self.data_criacao else None
+        }
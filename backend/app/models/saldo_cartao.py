@@ -0,0 +1,18 @@
+from app import db
+
+class SaldoCartao(db.Model):
+    """Soma das despesas em aberto (não pagas) de cada cartão, mantida a cada alteração de despesa"""
+    __tablename__ = 'saldos_cartoes'
+    
+    cartao_id = db.Column(db.Integer, db.ForeignKey('cartoes.id'), primary_key=True)
+    saldo_aberto = db.Column(db.Float, nullable=False, default=0.0)
+    quantidade = db.Column(db.Integer, nullable=False, default=0)
+    
+    cartao = db.relationship('Cartao', backref=db.backref('saldo', uselist=False, lazy='joined', viewonly=True))
+    
+    def to_dict(self):
+        return {
+            'cartao_id': self.cartao_id,
+            'saldo_aberto': self.saldo_aberto,
+            'quantidade': self.quantidade
+        }
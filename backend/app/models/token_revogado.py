@@ -0,0 +1,20 @@
+from app import db
+from datetime import datetime
+
+class TokenRevogado(db.Model):
+    __tablename__ = 'tokens_revogados'
+    
+    id = db.Column(db.Integer, primary_key=True)  # Crescente: permite recarga incremental da lista em memória
+    jti = db.Column(db.String(36), nullable=False, unique=True)
+    usuario_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'))
+    expira_em = db.Column(db.DateTime, nullable=False)  # Após expirar o token, a linha pode ser removida
+    data_revogacao = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'jti': self.jti,
+            'usuario_id': self.usuario_id,
+            'expira_em': self.expira_em.isoformat() if self.expira_em else None,
+            'data_revogacao': self.data_revogacao.isoformat() if self.data_revogacao else None
+        }
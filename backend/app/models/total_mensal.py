@@ -0,0 +1,33 @@
+from app import db
+
+class TotalMensal(db.Model):
+    __tablename__ = 'totais_mensais'
+
+    id = db.Column(db.Integer, primary_key=True)
+    origem = db.Column(db.String(20), nullable=False)  # despesa ou aporte
+    ano = db.Column(db.Integer, nullable=False)
+    mes = db.Column(db.Integer, nullable=False)
+    categoria_id = db.Column(db.Integer)  # Apenas para despesas
+    status = db.Column(db.String(20))  # Apenas para despesas
+    usuario_id = db.Column(db.Integer)  # pago_por_id da despesa ou usuario_id do aporte
+    total = db.Column(db.Float, nullable=False, default=0.0)
+    total_dividido = db.Column(db.Float, nullable=False, default=0.0)  # Soma de valor_dividido (despesas)
+    quantidade = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.Index('ix_totais_mensais_chave', 'origem', 'ano', 'mes', 'categoria_id', 'status', 'usuario_id'),
+    )
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'origem': self.origem,
+            'ano': self.ano,
+            'mes': self.mes,
+            'categoria_id': self.categoria_id,
+            'status': self.status,
+            'usuario_id': self.usuario_id,
+            'total': self.total,
+            'total_dividido': self.total_dividido,
+            'quantidade': self.quantidade
+        }
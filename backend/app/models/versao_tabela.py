@@ -0,0 +1,13 @@
+from app import db
+
+class VersaoTabela(db.Model):
+    __tablename__ = 'versoes_tabelas'
+    
+    tabela = db.Column(db.String(50), primary_key=True)
+    versao = db.Column(db.Integer, nullable=False, default=0)  # Incrementada a cada escrita na tabela
+    
+    def to_dict(self):
+        return {
+            'tabela': self.tabela,
+            'versao': self.versao
+        }
@@ -5,6 +5,7 @@ from app.routes.despesas import despesas_bp
 from app.routes.aportes import aportes_bp
 from app.routes.cartoes import cartoes_bp
 from app.routes.dashboard import dashboard_bp
+from app.routes.busca import busca_bp
 
 # Importar todos os blueprints para que sejam registrados no app
-__all__ = ['auth_bp', 'usuarios_bp', 'despesas_bp', 'aportes_bp', 'cartoes_bp', 'dashboard_bp']
+__all__ = ['auth_bp', 'usuarios_bp', 'despesas_bp', 'aportes_bp', 'cartoes_bp', 'dashboard_bp', 'busca_bp']
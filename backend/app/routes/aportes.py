@@ -1,14 +1,69 @@
-from flask import Blueprint, jsonify, request
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask import Blueprint, Response, jsonify, request, stream_with_context
+from flask_jwt_extended import jwt_required
 from datetime import datetime
+from sqlalchemy.orm import joinedload
 from app.models.aporte import Aporte
 from app.models.usuario import Usuario
+from app.utils.agregacoes import totais_aportes_periodo
+from app.utils.exportacao import consulta_exportacao_aportes, GERADORES, FORMATOS
+from app.utils.busca import busca_disponivel, ids_correspondentes
+from app.utils.cache import em_cache
+from app.utils.contagens import contagens_aproximadas
+from app.utils.paginacao import paginar_por_cursor, CursorInvalido
+from app.utils.versoes import versao_de
+from app.utils.autorizacao import admin_obrigatorio
+from app.utils.etag import com_etag
 from app import db
 
 aportes_bp = Blueprint('aportes', __name__)
 
+MAXIMO_ANOS_TOTAIS = 20
+
+def _filtros_listagem(usuario_id, data_inicio, data_fim, busca):
+    """Condições de filtro da listagem; levanta ValueError com a mensagem de erro"""
+    filtros = []
+    
+    if usuario_id:
+        filtros.append(Aporte.usuario_id == usuario_id)
+    
+    if data_inicio:
+        try:
+            filtros.append(Aporte.data >= datetime.fromisoformat(data_inicio).date())
+        except ValueError:
+            raise ValueError('Formato de data inicial inválido')
+    
+    if data_fim:
+        try:
+            filtros.append(Aporte.data <= datetime.fromisoformat(data_fim).date())
+        except ValueError:
+            raise ValueError('Formato de data final inválido')
+    
+    if busca:
+        if busca_disponivel(db.session.connection()):
+            filtros.append(Aporte.id.in_(ids_correspondentes('aporte', busca)))
+        else:
+            filtros.append(Aporte.observacao.ilike(f'%{busca}%'))
+    
+    return filtros
+
+def _chave_contagem(usuario_id, data_inicio, data_fim, busca):
+    return ('aportes', usuario_id, data_inicio, data_fim, busca)
+
+def _estado_contagem():
+    """No modo cursor o corpo muda quando a contagem em segundo plano termina; entra no ETag"""
+    if request.args.get('cursor') is None and request.args.get('paginacao') != 'cursor':
+        return None
+    chave = _chave_contagem(
+        request.args.get('usuario_id', type=int),
+        request.args.get('data_inicio'),
+        request.args.get('data_fim'),
+        request.args.get('busca')
+    )
+    return contagens_aproximadas.exato(chave, versao_de('aportes'))
+
 @aportes_bp.route('/', methods=['GET'])
 @jwt_required()
+@com_etag('aportes', 'usuarios', complemento=_estado_contagem)
 def listar_aportes():
     # Parâmetros de filtro com tratamento de erros aprimorado
     try:
@@ -21,32 +76,45 @@ def listar_aportes():
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 20, type=int)
         per_page = min(per_page, 100)  # Limitar tamanho da página
+        cursor = request.args.get('cursor')
+        por_cursor = cursor is not None or request.args.get('paginacao') == 'cursor'
     except (ValueError, TypeError) as e:
         return jsonify({'error': f'Parâmetro inválido: {str(e)}'}), 400
     
-    # Consulta base
-    query = Aporte.query
-    
-    # Aplicar filtros
-    if usuario_id:
-        query = query.filter(Aporte.usuario_id == usuario_id)
+    try:
+        filtros = _filtros_listagem(usuario_id, data_inicio, data_fim, busca)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    if data_inicio:
-        try:
-            data_inicio_obj = datetime.fromisoformat(data_inicio).date()
-            query = query.filter(Aporte.data >= data_inicio_obj)
-        except ValueError:
-            return jsonify({'error': 'Formato de data inicial inválido'}), 400
+    # Consulta base
+    query = Aporte.query.options(joinedload(Aporte.usuario)).filter(*filtros)
     
-    if data_fim:
+    if por_cursor:
+        # Cursor por (data, id): uma consulta por página, sem COUNT nem OFFSET
+        if per_page < 1:
+            return jsonify({'error': 'per_page inválido'}), 400
         try:
-            data_fim_obj = datetime.fromisoformat(data_fim).date()
-            query = query.filter(Aporte.data <= data_fim_obj)
-        except ValueError:
-            return jsonify({'error': 'Formato de data final inválido'}), 400
-    
-    if busca:
-        query = query.filter(Aporte.observacao.ilike(f'%{busca}%'))
+            aportes, proximo_cursor = paginar_por_cursor(query, Aporte.data, Aporte.id, cursor, per_page)
+        except CursorInvalido as e:
+            return jsonify({'error': str(e)}), 400
+        
+        # Total do último COUNT feito em segundo plano para estes filtros
+        total, total_exato = contagens_aproximadas.obter(
+            _chave_contagem(usuario_id, data_inicio, data_fim, busca),
+            versao_de('aportes'),
+            lambda: db.session.query(db.func.count(Aporte.id)).filter(
+                *_filtros_listagem(usuario_id, data_inicio, data_fim, busca)
+            ).scalar()
+        )
+        
+        return jsonify({
+            'items': [aporte.to_dict() for aporte in aportes],
+            'next_cursor': proximo_cursor,
+            'has_more': proximo_cursor is not None,
+            'per_page': per_page,
+            'total': total,
+            'total_exato': total_exato
+        }), 200
     
     # Ordenar por data
     query = query.order_by(Aporte.data.desc())
@@ -63,8 +131,40 @@ def listar_aportes():
         'per_page': per_page
     }), 200
 
+@aportes_bp.route('/exportar', methods=['GET'])
+@jwt_required()
+@admin_obrigatorio
+@com_etag('aportes', 'usuarios')
+def exportar_aportes():
+    formato = request.args.get('formato', 'csv')
+    if formato not in GERADORES:
+        return jsonify({'error': 'Formato inválido (use csv ou ndjson)'}), 400
+    
+    consulta = consulta_exportacao_aportes()
+    
+    usuario_id = request.args.get('usuario_id', type=int)
+    if usuario_id:
+        consulta = consulta.where(Aporte.usuario_id == usuario_id)
+    
+    try:
+        data_inicio = request.args.get('data_inicio')
+        if data_inicio:
+            consulta = consulta.where(Aporte.data >= datetime.fromisoformat(data_inicio).date())
+        data_fim = request.args.get('data_fim')
+        if data_fim:
+            consulta = consulta.where(Aporte.data <= datetime.fromisoformat(data_fim).date())
+    except ValueError:
+        return jsonify({'error': 'Formato de data inválido'}), 400
+    
+    return Response(
+        stream_with_context(GERADORES[formato](consulta)),
+        mimetype=FORMATOS[formato],
+        headers={'Content-Disposition': f'attachment; filename=aportes.{formato}'}
+    )
+
 @aportes_bp.route('/<int:id>', methods=['GET'])
 @jwt_required()
+@com_etag('aportes', 'usuarios')
 def obter_aporte(id):
     aporte = Aporte.query.get(id)
     
@@ -75,14 +175,8 @@ def obter_aporte(id):
 
 @aportes_bp.route('/', methods=['POST'])
 @jwt_required()
+@admin_obrigatorio
 def criar_aporte():
-    usuario_id = get_jwt_identity()
-    usuario = Usuario.query.get(int(usuario_id))
-    
-    # Verificar se é admin
-    if usuario.tipo != 'admin':
-        return jsonify({'error': 'Permissão negada'}), 403
-    
     data = request.get_json()
     
     # Validar dados obrigatórios
@@ -126,14 +220,8 @@ def criar_aporte():
 
 @aportes_bp.route('/<int:id>', methods=['PUT'])
 @jwt_required()
+@admin_obrigatorio
 def atualizar_aporte(id):
-    usuario_id = get_jwt_identity()
-    usuario = Usuario.query.get(int(usuario_id))
-    
-    # Verificar se é admin
-    if usuario.tipo != 'admin':
-        return jsonify({'error': 'Permissão negada'}), 403
-    
     aporte = Aporte.query.get(id)
     if not aporte:
         return jsonify({'error': 'Aporte não encontrado'}), 404
@@ -171,14 +259,8 @@ def atualizar_aporte(id):
 
 @aportes_bp.route('/<int:id>', methods=['DELETE'])
 @jwt_required()
+@admin_obrigatorio
 def excluir_aporte(id):
-    usuario_id = get_jwt_identity()
-    usuario = Usuario.query.get(int(usuario_id))
-    
-    # Verificar se é admin
-    if usuario.tipo != 'admin':
-        return jsonify({'error': 'Permissão negada'}), 403
-    
     aporte = Aporte.query.get(id)
     if not aporte:
         return jsonify({'error': 'Aporte não encontrado'}), 404
@@ -190,47 +272,22 @@ def excluir_aporte(id):
 
 @aportes_bp.route('/totais', methods=['GET'])
 @jwt_required()
+@com_etag('aportes', 'usuarios')
+@em_cache('aportes', 'usuarios')
 def totais_aportes():
     # Parâmetros de filtro com tratamento de erros
     try:
         usuario_id = request.args.get('usuario_id', type=int)
         ano = request.args.get('ano', type=int, default=datetime.now().year)
+        ano_inicio = request.args.get('ano_inicio', type=int, default=ano)
+        ano_fim = request.args.get('ano_fim', type=int, default=ano_inicio if 'ano_inicio' in request.args else ano)
     except (ValueError, TypeError) as e:
         return jsonify({'error': f'Parâmetro inválido: {str(e)}'}), 400
     
-    # Consulta base
-    query = Aporte.query.filter(
-        db.extract('year', Aporte.data) == ano
-    )
+    if ano_inicio > ano_fim:
+        return jsonify({'error': 'ano_inicio deve ser menor ou igual a ano_fim'}), 400
+    if ano_fim - ano_inicio >= MAXIMO_ANOS_TOTAIS:
+        return jsonify({'error': f'Intervalo máximo de {MAXIMO_ANOS_TOTAIS} anos'}), 400
     
-    if usuario_id:
-        query = query.filter(Aporte.usuario_id == usuario_id)
-    
-    # Calcular totais
-    aportes = query.all()
-    
-    total_geral = sum(aporte.valor for aporte in aportes)
-    
-    # Agrupar por usuário
-    totais_por_usuario = {}
-    for aporte in aportes:
-        if aporte.usuario_id not in totais_por_usuario:
-            totais_por_usuario[aporte.usuario_id] = {
-                'usuario': aporte.usuario.to_dict(),
-                'total': 0
-            }
-        totais_por_usuario[aporte.usuario_id]['total'] += aporte.valor
-    
-    # Agrupar por mês
-    totais_por_mes = {}
-    for aporte in aportes:
-        mes = aporte.data.month
-        if mes not in totais_por_mes:
-            totais_por_mes[mes] = 0
-        totais_por_mes[mes] += aporte.valor
-    
-    return jsonify({
-        'total_geral': total_geral,
-        'totais_por_usuario': list(totais_por_usuario.values()),
-        'totais_por_mes': [{'mes': mes, 'total': total} for mes, total in totais_por_mes.items()]
-    }), 200
+    # Totais lidos de totais_mensais: O(usuários x meses) linhas em vez de O(aportes)
+    return jsonify(totais_aportes_periodo(ano_inicio, ano_fim, usuario_id)), 200
@@ -1,7 +1,10 @@
 from flask import Blueprint, jsonify, request
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
+from flask_jwt_extended import create_access_token, jwt_required, get_jwt, get_jwt_identity
 from werkzeug.security import generate_password_hash, check_password_hash
 from app.models.usuario import Usuario
+from app.utils.autorizacao import claims_usuario, identidades
+from app.utils.etag import com_etag
+from app.utils.revogacao import revogar_token
 from app import db
 
 auth_bp = Blueprint('auth', __name__)
@@ -22,7 +25,7 @@ def login():
         return jsonify({'error': 'Usuário desativado'}), 401
     
     # ✅ Correção: identity precisa ser string
-    access_token = create_access_token(identity=str(usuario.id))
+    access_token = create_access_token(identity=str(usuario.id), additional_claims=claims_usuario(usuario))
 
     return jsonify({
         'token': access_token,
@@ -54,9 +57,10 @@ def registro():
     
     db.session.add(novo_usuario)
     db.session.commit()
+    identidades.invalidar()
     
     # ✅ Correção: identity precisa ser string
-    access_token = create_access_token(identity=str(novo_usuario.id))
+    access_token = create_access_token(identity=str(novo_usuario.id), additional_claims=claims_usuario(novo_usuario))
     
     return jsonify({
         'token': access_token,
@@ -65,6 +69,7 @@ def registro():
 
 @auth_bp.route('/verificar', methods=['GET'])
 @jwt_required()
+@com_etag('usuarios')
 def verificar():
     usuario_id = get_jwt_identity()
     
@@ -78,3 +83,9 @@ def verificar():
         return jsonify({'error': 'Usuário desativado'}), 401
     
     return jsonify({'user': usuario.to_dict()}), 200
+
+@auth_bp.route('/logout', methods=['POST'])
+@jwt_required()
+def logout():
+    revogar_token(get_jwt())
+    return jsonify({'message': 'Logout realizado com sucesso'}), 200
@@ -0,0 +1,39 @@
+from flask import Blueprint, jsonify, request
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from app.utils.busca import TIPOS, buscar, busca_disponivel
+from app.utils.autorizacao import eh_admin
+from app.utils.etag import com_etag
+from app import db
+
+busca_bp = Blueprint('busca', __name__)
+
+@busca_bp.route('/', methods=['GET'])
+@jwt_required()
+@com_etag('despesas', 'aportes', 'categorias', 'cartoes', 'usuarios')
+def buscar_textos():
+    try:
+        termo = (request.args.get('q') or '').strip()
+        tipo = request.args.get('tipo')
+        page = max(request.args.get('page', 1, type=int), 1)
+        per_page = min(request.args.get('per_page', 20, type=int), 100)
+    except (ValueError, TypeError) as e:
+        return jsonify({'error': f'Parâmetro inválido: {str(e)}'}), 400
+    
+    if not termo:
+        return jsonify({'error': 'Parâmetro q é obrigatório'}), 400
+    
+    if tipo and tipo not in TIPOS:
+        return jsonify({'error': 'Tipo inválido (use despesa ou aporte)'}), 400
+    
+    if not busca_disponivel(db.session.connection()):
+        return jsonify({'error': 'Índice de busca não configurado; execute flask migrar'}), 503
+    
+    # Quem não é admin só encontra as próprias despesas e aportes
+    dono_id = None if eh_admin() else int(get_jwt_identity())
+    resultados = buscar(termo, [tipo] if tipo else None, page, per_page, dono_id)
+    
+    return jsonify({
+        'items': resultados,
+        'page': page,
+        'per_page': per_page
+    }), 200
@@ -1,15 +1,25 @@
 from flask import Blueprint, jsonify, request
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from datetime import datetime
+from flask_jwt_extended import jwt_required
+from datetime import MAXYEAR, MINYEAR, datetime
+from sqlalchemy.orm import joinedload, with_parent
 from app.models.cartao import Cartao
 from app.models.despesa import Despesa
-from app.models.usuario import Usuario
+from app.models.fatura import Fatura
+from app.models.saldo_cartao import SaldoCartao
+from app.utils.carregamento import opcoes_serializacao_despesa
+from app.utils.autorizacao import admin_obrigatorio
+from app.utils.etag import com_etag
+from app.utils.calendario_faturas import calendario_cartao, somar_meses
+from app.utils.faturas import filtro_janelas, proximos_ciclos, status_fatura, totais_por_cartao, totais_por_ciclo
 from app import db
 
 cartoes_bp = Blueprint('cartoes', __name__)
 
+MAXIMO_PROXIMAS_FATURAS = 60
+
 @cartoes_bp.route('/', methods=['GET'])
 @jwt_required()
+@com_etag('cartoes', 'usuarios', 'despesas')
 def listar_cartoes():
     # Parâmetros de filtro com tratamento de erros aprimorado
     try:
@@ -31,8 +41,70 @@ def listar_cartoes():
     
     return jsonify([cartao.to_dict() for cartao in cartoes]), 200
 
+@cartoes_bp.route('/faturas', methods=['GET'])
+@jwt_required()
+@com_etag('despesas', 'categorias', 'cartoes', 'usuarios')
+def faturas_consolidadas():
+    try:
+        mes = request.args.get('mes', type=int)
+        ano = request.args.get('ano', type=int)
+        if mes is not None and not 1 <= mes <= 12:
+            return jsonify({'error': 'Mês inválido'}), 400
+        # Ciclos vizinhos (início e vencimento) precisam caber no intervalo de date
+        if ano is not None and not MINYEAR < ano < MAXYEAR:
+            return jsonify({'error': 'Ano inválido'}), 400
+        incluir_despesas = request.args.get('incluir_despesas', 'false').lower() == 'true'
+    except (ValueError, TypeError) as e:
+        return jsonify({'error': f'Parâmetro inválido: {str(e)}'}), 400
+    
+    hoje = datetime.now().date()
+    cartoes = Cartao.query.options(joinedload(Cartao.usuario)).order_by(Cartao.nome).all()
+    
+    # Fatura que fecha no mês informado, ou a fatura em aberto de cada cartão
+    ciclos = {}
+    for cartao in cartoes:
+        calendario = calendario_cartao(cartao)
+        if mes or ano:
+            ciclos[cartao.id] = calendario.ciclo(ano or hoje.year, mes or hoje.month)
+        else:
+            ciclos[cartao.id] = calendario.ciclo_da_data(hoje)
+    
+    totais = totais_por_cartao(ciclos)
+    
+    despesas_por_cartao = {}
+    if incluir_despesas and ciclos:
+        despesas = Despesa.query.options(*opcoes_serializacao_despesa()).filter(
+            filtro_janelas(ciclos)
+        ).order_by(Despesa.data_compra, Despesa.id).all()
+        for despesa in despesas:
+            despesas_por_cartao.setdefault(despesa.cartao_id, []).append(despesa.to_dict())
+    
+    faturas = []
+    for cartao in cartoes:
+        ciclo = ciclos[cartao.id]
+        valor_total, quantidade_despesas, pendentes = totais[cartao.id]
+        fatura = {
+            'cartao': cartao.to_dict(),
+            'mes': ciclo.mes,
+            'ano': ciclo.ano,
+            'data_fechamento': ciclo.fechamento.isoformat(),
+            'data_vencimento': ciclo.vencimento.isoformat(),
+            'valor_total': valor_total,
+            'quantidade_despesas': quantidade_despesas,
+            'status': 'aberta' if ciclo.fechamento >= hoje else status_fatura(quantidade_despesas, pendentes)
+        }
+        if incluir_despesas:
+            fatura['despesas'] = despesas_por_cartao.get(cartao.id, [])
+        faturas.append(fatura)
+    
+    return jsonify({
+        'faturas': faturas,
+        'valor_total': sum(fatura['valor_total'] for fatura in faturas)
+    }), 200
+
 @cartoes_bp.route('/<int:id>', methods=['GET'])
 @jwt_required()
+@com_etag('cartoes', 'usuarios', 'despesas')
 def obter_cartao(id):
     cartao = Cartao.query.get(id)
     
@@ -43,14 +115,8 @@ def obter_cartao(id):
 
 @cartoes_bp.route('/', methods=['POST'])
 @jwt_required()
+@admin_obrigatorio
 def criar_cartao():
-    usuario_id = get_jwt_identity()
-    usuario = Usuario.query.get(int(usuario_id))
-    
-    # Verificar se é admin
-    if usuario.tipo != 'admin':
-        return jsonify({'error': 'Permissão negada'}), 403
-    
     data = request.get_json()
     
     # Validar dados obrigatórios
@@ -99,14 +165,8 @@ def criar_cartao():
 
 @cartoes_bp.route('/<int:id>', methods=['PUT'])
 @jwt_required()
+@admin_obrigatorio
 def atualizar_cartao(id):
-    usuario_id = get_jwt_identity()
-    usuario = Usuario.query.get(int(usuario_id))
-    
-    # Verificar se é admin
-    if usuario.tipo != 'admin':
-        return jsonify({'error': 'Permissão negada'}), 403
-    
     cartao = Cartao.query.get(id)
     if not cartao:
         return jsonify({'error': 'Cartão não encontrado'}), 404
@@ -156,14 +216,8 @@ def atualizar_cartao(id):
 
 @cartoes_bp.route('/<int:id>', methods=['DELETE'])
 @jwt_required()
+@admin_obrigatorio
 def excluir_cartao(id):
-    usuario_id = get_jwt_identity()
-    usuario = Usuario.query.get(int(usuario_id))
-    
-    # Verificar se é admin
-    if usuario.tipo != 'admin':
-        return jsonify({'error': 'Permissão negada'}), 403
-    
     cartao = Cartao.query.get(id)
     if not cartao:
         return jsonify({'error': 'Cartão não encontrado'}), 404
@@ -172,7 +226,10 @@ def excluir_cartao(id):
     despesas = Despesa.query.filter_by(cartao_id=id).first()
     if despesas:
         return jsonify({'error': 'Não é possível excluir cartão com despesas associadas'}), 400
-    
+
+    # Tabelas derivadas referenciam o cartão e não são removidas em cascata pelo ORM
+    SaldoCartao.query.filter_by(cartao_id=id).delete()
+    Fatura.query.filter_by(cartao_id=id).delete()
     db.session.delete(cartao)
     db.session.commit()
     
@@ -180,6 +237,7 @@ def excluir_cartao(id):
 
 @cartoes_bp.route('/<int:id>/faturas', methods=['GET'])
 @jwt_required()
+@com_etag('despesas', 'categorias', 'cartoes', 'usuarios', 'faturas')
 def fatura_cartao(id):
     cartao = Cartao.query.get(id)
     if not cartao:
@@ -196,72 +254,83 @@ def fatura_cartao(id):
         return jsonify({'error': f'Parâmetro inválido: {str(e)}'}), 400
     
     # Se não informados, usar data atual
-    hoje = datetime.now()
+    hoje = datetime.now().date()
     if not mes:
         mes = hoje.month
     if not ano:
         ano = hoje.year
     
-    # Calcular data de fechamento da fatura
-    dia_fechamento = cartao.dia_fechamento
-    data_fechamento = datetime(ano, mes, dia_fechamento).date()
-    
     # Se já passou do dia de fechamento, a fatura atual é do próximo mês
-    if hoje.day > dia_fechamento:
-        mes += 1
-        if mes > 12:
-            mes = 1
-            ano += 1
-        data_fechamento = datetime(ano, mes, dia_fechamento).date()
-    
-    # Calcular data de fechamento anterior
-    mes_anterior = mes - 1
-    ano_anterior = ano
-    if mes_anterior < 1:
-        mes_anterior = 12
-        ano_anterior -= 1
-    
-    data_fechamento_anterior = datetime(ano_anterior, mes_anterior, dia_fechamento).date()
-    
-    # Buscar despesas da fatura
-    despesas_fatura = Despesa.query.filter(
-        Despesa.cartao_id == id,
-        Despesa.data_compra > data_fechamento_anterior,
-        Despesa.data_compra <= data_fechamento
-    ).order_by(Despesa.data_compra).all()
-    
-    # Calcular valor total da fatura
-    valor_total = sum(despesa.valor_total for despesa in despesas_fatura)
-    
-    # Calcular data de vencimento
-    dia_vencimento = cartao.dia_vencimento
-    mes_vencimento = mes
-    ano_vencimento = ano
-    
-    if dia_vencimento < dia_fechamento:
-        # Se o vencimento é antes do fechamento, o vencimento é no mês seguinte
-        mes_vencimento += 1
-        if mes_vencimento > 12:
-            mes_vencimento = 1
-            ano_vencimento += 1
-    
-    data_vencimento = datetime(ano_vencimento, mes_vencimento, dia_vencimento).date()
+    calendario = calendario_cartao(cartao)
+    if hoje > calendario.ciclo(hoje.year, hoje.month).fechamento:
+        ano, mes = somar_meses(ano, mes, 1)
+    
+    ciclo = calendario.ciclo(ano, mes)
+    consulta_despesas = Despesa.query.options(*opcoes_serializacao_despesa())
+    
+    # Ciclos fechados são servidos da fotografia gravada por fechar_faturas
+    snapshot = None
+    if ciclo.fechamento < hoje:
+        snapshot = Fatura.query.filter_by(cartao_id=id, ano=ano, mes=mes).first()
+    
+    if snapshot:
+        despesas_fatura = consulta_despesas.filter(
+            with_parent(snapshot, Fatura.despesas)
+        ).order_by(Despesa.data_compra).all()
+        valor_total = snapshot.valor_total
+        status = snapshot.status
+    else:
+        despesas_fatura = consulta_despesas.filter(
+            Despesa.cartao_id == id,
+            Despesa.data_compra > ciclo.inicio,
+            Despesa.data_compra <= ciclo.fechamento
+        ).order_by(Despesa.data_compra).all()
+        valor_total = sum(despesa.valor_total for despesa in despesas_fatura)
+        if ciclo.fechamento >= hoje:
+            status = 'aberta'
+        else:
+            status = status_fatura(
+                len(despesas_fatura), sum(1 for despesa in despesas_fatura if despesa.status != 'pago')
+            )
     
     # Preparar resposta
     fatura = {
+        'id': snapshot.id if snapshot else None,
         'cartao': cartao.to_dict(),
         'mes': mes,
         'ano': ano,
-        'data_fechamento': data_fechamento.isoformat(),
-        'data_vencimento': data_vencimento.isoformat(),
+        'data_fechamento': ciclo.fechamento.isoformat(),
+        'data_vencimento': ciclo.vencimento.isoformat(),
         'valor_total': valor_total,
+        'status': status,
         'despesas': [despesa.to_dict() for despesa in despesas_fatura]
     }
     
     return jsonify(fatura), 200
 
+@cartoes_bp.route('/<int:id>/faturas/fechadas', methods=['GET'])
+@jwt_required()
+@com_etag('faturas', 'cartoes')
+def faturas_fechadas(id):
+    cartao = Cartao.query.get(id)
+    if not cartao:
+        return jsonify({'error': 'Cartão não encontrado'}), 404
+    
+    try:
+        ano = request.args.get('ano', type=int)
+    except (ValueError, TypeError) as e:
+        return jsonify({'error': f'Parâmetro inválido: {str(e)}'}), 400
+    
+    query = Fatura.query.filter(Fatura.cartao_id == id)
+    if ano:
+        query = query.filter(Fatura.ano == ano)
+    
+    faturas = query.order_by(Fatura.data_fechamento.desc()).all()
+    return jsonify([fatura.to_dict() for fatura in faturas]), 200
+
 @cartoes_bp.route('/<int:id>/proximas_faturas', methods=['GET'])
 @jwt_required()
+@com_etag('cartoes', 'despesas')
 def proximas_faturas(id):
     cartao = Cartao.query.get(id)
     if not cartao:
@@ -274,71 +343,23 @@ def proximas_faturas(id):
     except (ValueError, TypeError) as e:
         return jsonify({'error': f'Parâmetro inválido: {str(e)}'}), 400
     
-    hoje = datetime.now()
-    faturas = []
+    if not 1 <= quantidade <= MAXIMO_PROXIMAS_FATURAS:
+        return jsonify({'error': f'quantidade deve estar entre 1 e {MAXIMO_PROXIMAS_FATURAS}'}), 400
     
-    # Calcular data de fechamento atual
-    ano = hoje.year
-    mes = hoje.month
-    
-    # Se já passou do dia de fechamento, a próxima fatura fecha no próximo mês
-    if hoje.day > cartao.dia_fechamento:
-        mes += 1
-        if mes > 12:
-            mes = 1
-            ano += 1
-    
-    # Calcular próximas faturas
-    for i in range(quantidade):
-        # Calcular data de fechamento
-        data_fechamento = datetime(ano, mes, cartao.dia_fechamento).date()
-        
-        # Calcular data de vencimento
-        mes_vencimento = mes
-        ano_vencimento = ano
-        
-        if cartao.dia_vencimento < cartao.dia_fechamento:
-            # Se o vencimento é antes do fechamento, o vencimento é no mês seguinte
-            mes_vencimento += 1
-            if mes_vencimento > 12:
-                mes_vencimento = 1
-                ano_vencimento += 1
-        
-        data_vencimento = datetime(ano_vencimento, mes_vencimento, cartao.dia_vencimento).date()
-        
-        # Calcular data de fechamento anterior
-        mes_anterior = mes - 1
-        ano_anterior = ano
-        if mes_anterior < 1:
-            mes_anterior = 12
-            ano_anterior -= 1
-        
-        data_fechamento_anterior = datetime(ano_anterior, mes_anterior, cartao.dia_fechamento).date()
-        
-        # Buscar despesas da fatura
-        despesas_fatura = Despesa.query.filter(
-            Despesa.cartao_id == id,
-            Despesa.data_compra > data_fechamento_anterior,
-            Despesa.data_compra <= data_fechamento
-        ).all()
-        
-        # Calcular valor total da fatura
-        valor_total = sum(despesa.valor_total for despesa in despesas_fatura)
-        
-        # Adicionar fatura à lista
-        faturas.append({
-            'mes': mes,
-            'ano': ano,
-            'data_fechamento': data_fechamento.isoformat(),
-            'data_vencimento': data_vencimento.isoformat(),
+    # Todos os ciclos somados numa única consulta agrupada por janela de fechamento
+    ciclos = proximos_ciclos(cartao, datetime.now().date(), quantidade)
+    totais = totais_por_ciclo(id, ciclos)
+    
+    faturas = [
+        {
+            'mes': ciclo.mes,
+            'ano': ciclo.ano,
+            'data_fechamento': ciclo.fechamento.isoformat(),
+            'data_vencimento': ciclo.vencimento.isoformat(),
             'valor_total': valor_total,
-            'quantidade_despesas': len(despesas_fatura)
-        })
-        
-        # Avançar para o próximo mês
-        mes += 1
-        if mes > 12:
-            mes = 1
-            ano += 1
+            'quantidade_despesas': quantidade_despesas
+        }
+        for ciclo, (valor_total, quantidade_despesas, _) in zip(ciclos, totais)
+    ]
     
     return jsonify(faturas), 200
@@ -1,85 +1,45 @@
 from flask import Blueprint, jsonify, request
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required
 from app.models.despesa import Despesa
-from app.models.aporte import Aporte
-from app.models.usuario import Usuario
-from app.models.categoria import Categoria
-from app import db
+from app.utils.saldos import saldos_investidores
+from app.utils.cache import em_cache
+from app.utils.etag import com_etag
+from app.utils.carregamento import opcoes_serializacao_despesa
+from app.utils.agregacoes import (
+    resumo_despesas_mes, total_aportes_mes, intervalo_meses, serie_mensal
+)
 from datetime import datetime, timedelta
-import calendar
 
 dashboard_bp = Blueprint('dashboard', __name__)
 
+MAXIMO_MESES_EVOLUCAO = 120
+
 @dashboard_bp.route('/resumo', methods=['GET'])
 @jwt_required()
+@com_etag('despesas', 'aportes', 'usuarios', 'categorias', 'cartoes')
+@em_cache('despesas', 'aportes', 'usuarios', 'categorias', 'cartoes')
 def resumo():
-    usuario_id = get_jwt_identity()
-    usuario = Usuario.query.get(usuario_id)
-    
     # Parâmetros de filtro
     mes = request.args.get('mes', type=int, default=datetime.now().month)
     ano = request.args.get('ano', type=int, default=datetime.now().year)
     
-    # Obter primeiro e último dia do mês
-    primeiro_dia = datetime(ano, mes, 1).date()
-    ultimo_dia = datetime(ano, mes, calendar.monthrange(ano, mes)[1]).date()
-    
-    # Resumo de despesas do mês
-    despesas_mes = Despesa.query.filter(
-        Despesa.data_vencimento >= primeiro_dia,
-        Despesa.data_vencimento <= ultimo_dia
-    ).all()
-    
-    total_despesas_mes = sum(despesa.valor_total for despesa in despesas_mes)
-    total_despesas_pagas = sum(despesa.valor_total for despesa in despesas_mes if despesa.status == 'pago')
-    total_despesas_pendentes = sum(despesa.valor_total for despesa in despesas_mes if despesa.status == 'pendente')
-    
-    # Despesas por categoria
-    despesas_por_categoria = {}
-    for despesa in despesas_mes:
-        categoria_id = despesa.categoria_id
-        if categoria_id not in despesas_por_categoria:
-            categoria = Categoria.query.get(categoria_id)
-            despesas_por_categoria[categoria_id] = {
-                'categoria': categoria.to_dict(),
-                'total': 0
-            }
-        despesas_por_categoria[categoria_id]['total'] += despesa.valor_total
+    # Resumo de despesas do mês (lido de totais_mensais, agrupado por categoria e status)
+    resumo_despesas = resumo_despesas_mes(ano, mes)
     
     # Aportes do mês
-    aportes_mes = Aporte.query.filter(
-        Aporte.data >= primeiro_dia,
-        Aporte.data <= ultimo_dia
-    ).all()
+    total_aportes_do_mes = total_aportes_mes(ano, mes)
     
-    total_aportes_mes = sum(aporte.valor for aporte in aportes_mes)
-    
-    # Saldos dos investidores
-    investidores = Usuario.query.filter_by(tipo='investidor', ativo=True).all()
-    saldos = []
-    
-    for investidor in investidores:
-        # Total de aportes
-        total_aportes = sum(aporte.valor for aporte in investidor.aportes)
-        
-        # Total de despesas divididas (valor dividido por investidor)
-        total_despesas_divididas = db.session.query(
-            db.func.sum(Despesa.valor_dividido)
-        ).filter(Despesa.status == 'pago').scalar() or 0
-        
-        # Calcular saldo
-        saldo = total_aportes - total_despesas_divididas
-        
-        saldos.append({
-            'usuario': investidor.to_dict(),
-            'saldo': saldo
-        })
+    # Saldos dos investidores (consultas indexadas em lancamentos_saldo)
+    saldos = [
+        {'usuario': saldo['usuario'].to_dict(), 'saldo': saldo['saldo']}
+        for saldo in saldos_investidores()
+    ]
     
     # Próximos vencimentos
     hoje = datetime.now().date()
     proximos_dias = hoje + timedelta(days=7)
     
-    proximos_vencimentos = Despesa.query.filter(
+    proximos_vencimentos = Despesa.query.options(*opcoes_serializacao_despesa()).filter(
         Despesa.data_vencimento >= hoje,
         Despesa.data_vencimento <= proximos_dias,
         Despesa.status == 'pendente'
@@ -89,11 +49,11 @@ def resumo():
     resumo = {
         'mes': mes,
         'ano': ano,
-        'total_despesas_mes': total_despesas_mes,
-        'total_despesas_pagas': total_despesas_pagas,
-        'total_despesas_pendentes': total_despesas_pendentes,
-        'despesas_por_categoria': list(despesas_por_categoria.values()),
-        'total_aportes_mes': total_aportes_mes,
+        'total_despesas_mes': resumo_despesas['total'],
+        'total_despesas_pagas': resumo_despesas['total_pago'],
+        'total_despesas_pendentes': resumo_despesas['total_pendente'],
+        'despesas_por_categoria': resumo_despesas['por_categoria'],
+        'total_aportes_mes': total_aportes_do_mes,
         'saldos': saldos,
         'proximos_vencimentos': [despesa.to_dict() for despesa in proximos_vencimentos]
     }
@@ -102,64 +62,21 @@ def resumo():
 
 @dashboard_bp.route('/evolucao', methods=['GET'])
 @jwt_required()
+@com_etag('despesas', 'aportes')
+@em_cache('despesas', 'aportes')
 def evolucao():
     # Parâmetros de filtro
     meses = request.args.get('meses', type=int, default=6)
+    if not 1 <= meses <= MAXIMO_MESES_EVOLUCAO:
+        return jsonify({'error': f'meses deve estar entre 1 e {MAXIMO_MESES_EVOLUCAO}'}), 400
     
-    # Data atual
+    # Meses do período, do mais antigo ao atual
     hoje = datetime.now().date()
-    mes_atual = hoje.month
-    ano_atual = hoje.year
-    
-    # Preparar dados de evolução
-    evolucao_despesas = []
-    evolucao_aportes = []
-    
-    for i in range(meses):
-        # Calcular mês e ano
-        mes = mes_atual - i
-        ano = ano_atual
-        
-        while mes <= 0:
-            mes += 12
-            ano -= 1
-        
-        # Obter primeiro e último dia do mês
-        primeiro_dia = datetime(ano, mes, 1).date()
-        ultimo_dia = datetime(ano, mes, calendar.monthrange(ano, mes)[1]).date()
-        
-        # Total de despesas do mês
-        despesas_mes = Despesa.query.filter(
-            Despesa.data_vencimento >= primeiro_dia,
-            Despesa.data_vencimento <= ultimo_dia
-        ).all()
-        
-        total_despesas = sum(despesa.valor_total for despesa in despesas_mes)
-        
-        # Total de aportes do mês
-        aportes_mes = Aporte.query.filter(
-            Aporte.data >= primeiro_dia,
-            Aporte.data <= ultimo_dia
-        ).all()
-        
-        total_aportes = sum(aporte.valor for aporte in aportes_mes)
-        
-        # Adicionar aos dados de evolução
-        evolucao_despesas.append({
-            'mes': mes,
-            'ano': ano,
-            'total': total_despesas
-        })
-        
-        evolucao_aportes.append({
-            'mes': mes,
-            'ano': ano,
-            'total': total_aportes
-        })
+    periodo = intervalo_meses(hoje.year, hoje.month, meses)
     
-    # Inverter para ordem cronológica
-    evolucao_despesas.reverse()
-    evolucao_aportes.reverse()
+    # Uma consulta agrupada sobre totais_mensais para cada série
+    evolucao_despesas = serie_mensal('despesa', periodo)
+    evolucao_aportes = serie_mensal('aporte', periodo)
     
     return jsonify({
         'evolucao_despesas': evolucao_despesas,
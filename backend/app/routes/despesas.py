@@ -1,24 +1,35 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, jsonify, request, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from datetime import datetime
-from sqlalchemy import extract
+from datetime import date, datetime
 from app.models.despesa import Despesa
-from app.models.usuario import Usuario
 from app.models.categoria import Categoria
 from app.models.cartao import Cartao
+from app.utils.carregamento import opcoes_serializacao_despesa
+from app.utils.importacao import ler_csv, ler_ofx, importar_despesas
+from app.utils.status_lote import atualizar_status_em_lote
+from app.utils.calendario_faturas import intervalo_fatura
+from app.utils.recorrencias import expandir_despesa, ocorrencias_virtuais, familia_despesa, resumo_familia
+from app.utils.exportacao import consulta_exportacao_despesas, GERADORES, FORMATOS
+from app.utils.limites_cartoes import verificar_limite
+from app.utils.busca import busca_disponivel, ids_correspondentes
+from app.utils.paginacao import paginar_por_cursor, CursorInvalido
+from app.utils.autorizacao import admin_obrigatorio, eh_admin
+from app.utils.etag import com_etag
 from app import db
 
 despesas_bp = Blueprint("despesas", __name__)
 
+MAXIMO_ANOS_OCORRENCIAS = 5
+
 @despesas_bp.route("/", methods=["GET"])
 @jwt_required()
+@com_etag('despesas', 'categorias', 'cartoes', 'usuarios')
 def listar_despesas():
     usuario_id = get_jwt_identity()
-    usuario = Usuario.query.get(int(usuario_id))
-    
-    query = Despesa.query
 
-    if usuario.tipo != 'admin':
+    query = Despesa.query.options(*opcoes_serializacao_despesa())
+
+    if not eh_admin():
         query = query.filter(Despesa.usuario_id == int(usuario_id))
 
     categoria_id = request.args.get('categoria_id')
@@ -36,21 +47,26 @@ def listar_despesas():
     if tipo:
         query = query.filter(Despesa.tipo == tipo)
 
+    # Intervalos semiabertos em data_compra para que os filtros usem índice
     mes = request.args.get('mes')
     ano = request.args.get('ano')
     if mes and ano:
         try:
-            query = query.filter(
-                extract('month', Despesa.data_compra) == int(mes),
-                extract('year', Despesa.data_compra) == int(ano)
-            )
+            mes = int(mes)
+            ano = int(ano)
+            inicio = date(ano, mes, 1)
+            fim = date(ano + mes // 12, mes % 12 + 1, 1)
         except ValueError:
             return jsonify({"error": "Mês ou ano inválido"}), 400
+        query = query.filter(Despesa.data_compra >= inicio, Despesa.data_compra < fim)
     elif ano:
         try:
-            query = query.filter(extract('year', Despesa.data_compra) == int(ano))
+            ano = int(ano)
+            inicio = date(ano, 1, 1)
+            fim = date(ano + 1, 1, 1)
         except ValueError:
             return jsonify({"error": "Ano inválido"}), 400
+        query = query.filter(Despesa.data_compra >= inicio, Despesa.data_compra < fim)
 
     cartao_id = request.args.get('cartao_id')
     if cartao_id:
@@ -59,20 +75,92 @@ def listar_despesas():
         except ValueError:
             return jsonify({"error": "cartao_id inválido"}), 400
 
+    busca = request.args.get('busca')
+    if busca:
+        if busca_disponivel(db.session.connection()):
+            query = query.filter(Despesa.id.in_(ids_correspondentes('despesa', busca)))
+        else:
+            query = query.filter(db.or_(
+                Despesa.descricao.ilike(f'%{busca}%'),
+                Despesa.origem.ilike(f'%{busca}%')
+            ))
+
+    # Paginação por cursor (data_compra, id), ativada ao informar per_page ou cursor
+    cursor = request.args.get('cursor')
+    per_page = request.args.get('per_page')
+    if cursor or per_page:
+        try:
+            per_page = min(int(per_page or 20), 100)
+            if per_page < 1:
+                return jsonify({"error": "per_page inválido"}), 400
+            despesas, proximo_cursor = paginar_por_cursor(
+                query, Despesa.data_compra, Despesa.id, cursor, per_page
+            )
+        except CursorInvalido as e:
+            return jsonify({"error": str(e)}), 400
+        except ValueError:
+            return jsonify({"error": "per_page inválido"}), 400
+
+        return jsonify({
+            "items": [d.to_dict() for d in despesas],
+            "next_cursor": proximo_cursor,
+            "per_page": per_page
+        }), 200
+
     despesas = query.order_by(Despesa.data_compra.desc()).all()
     return jsonify([d.to_dict() for d in despesas]), 200
 
+@despesas_bp.route("/exportar", methods=["GET"])
+@jwt_required()
+@admin_obrigatorio
+@com_etag('despesas', 'categorias', 'cartoes', 'usuarios')
+def exportar_despesas():
+    formato = request.args.get('formato', 'csv')
+    if formato not in GERADORES:
+        return jsonify({"error": "Formato inválido (use csv ou ndjson)"}), 400
+
+    consulta = consulta_exportacao_despesas()
+    try:
+        for campo in ('categoria_id', 'cartao_id'):
+            valor = request.args.get(campo)
+            if valor:
+                consulta = consulta.where(getattr(Despesa, campo) == int(valor))
+    except ValueError:
+        return jsonify({"error": "Filtro inválido"}), 400
+
+    status = request.args.get('status')
+    if status:
+        consulta = consulta.where(Despesa.status == status)
+
+    ano = request.args.get('ano')
+    if ano:
+        try:
+            ano = int(ano)
+            mes = request.args.get('mes', type=int)
+            inicio = date(ano, mes or 1, 1)
+            fim = date(ano + mes // 12, mes % 12 + 1, 1) if mes else date(ano + 1, 1, 1)
+        except ValueError:
+            return jsonify({"error": "Mês ou ano inválido"}), 400
+        consulta = consulta.where(Despesa.data_compra >= inicio, Despesa.data_compra < fim)
+
+    return Response(
+        stream_with_context(GERADORES[formato](consulta)),
+        mimetype=FORMATOS[formato],
+        headers={'Content-Disposition': f'attachment; filename=despesas.{formato}'}
+    )
+
 @despesas_bp.route("/<int:id>", methods=["GET"])
 @jwt_required()
+@com_etag('despesas', 'categorias', 'cartoes', 'usuarios')
 def obter_despesa(id):
     usuario_id = get_jwt_identity()
+
     despesa = Despesa.query.get(id)
 
     if not despesa:
         return jsonify({"error": "Despesa não encontrada"}), 404
 
-    usuario = Usuario.query.get(int(usuario_id))
-    if usuario.tipo != 'admin' and despesa.usuario_id != int(usuario_id):
+    if not eh_admin() and despesa.usuario_id != int(usuario_id):
         return jsonify({"error": "Permissão negada"}), 403
 
     return jsonify(despesa.to_dict()), 200
@@ -81,6 +169,7 @@ def obter_despesa(id):
 @jwt_required()
 def criar_despesa():
     usuario_id = get_jwt_identity()
+
     data = request.get_json()
 
     campos_obrigatorios = ['descricao', 'valor_total', 'data_compra', 'categoria_id', 'tipo']
@@ -122,6 +211,13 @@ def criar_despesa():
     except (ValueError, TypeError):
         return jsonify({"error": "Número de parcelas inválido"}), 400
 
+    # Saldo em aberto do cartão é mantido incrementalmente: a checagem não percorre despesas
+    aviso_limite = None
+    if data.get('status', 'pendente') != 'pago':
+        erro_limite, aviso_limite = verificar_limite(cartao_id, valor_total)
+        if erro_limite:
+            return jsonify({"error": erro_limite}), 400
+
     nova_despesa = Despesa(
         descricao=data['descricao'],
         valor_total=valor_total,
@@ -139,22 +235,151 @@ def criar_despesa():
     db.session.add(nova_despesa)
     db.session.commit()
 
-    return jsonify(nova_despesa.to_dict()), 201
+    resposta = nova_despesa.to_dict()
+    if aviso_limite:
+        resposta['aviso_limite'] = aviso_limite
+    return jsonify(resposta), 201
+
+@despesas_bp.route("/importar", methods=["POST"])
+@jwt_required()
+def importar_despesas_arquivo():
+    usuario_id = get_jwt_identity()
+
+    arquivo = request.files.get('arquivo')
+    if not arquivo or not arquivo.filename:
+        return jsonify({"error": "Arquivo é obrigatório"}), 400
+
+    formato = (request.form.get('formato') or arquivo.filename.rsplit('.', 1)[-1]).lower()
+    if formato not in ['csv', 'ofx']:
+        return jsonify({"error": "Formato inválido (use csv ou ofx)"}), 400
+
+    # Valores usados quando a linha não informa categoria, cartão ou status (obrigatórios no OFX)
+    padroes = {
+        'categoria_id': request.form.get('categoria_id'),
+        'cartao_id': request.form.get('cartao_id'),
+        'pago_por_id': int(usuario_id),
+        'pago_por_livre': eh_admin(),
+        'status': request.form.get('status', 'pendente')
+    }
+
+    registros = ler_csv(arquivo.stream) if formato == 'csv' else ler_ofx(arquivo.stream)
+    relatorio = importar_despesas(registros, padroes)
+
+    return jsonify(relatorio), 201 if relatorio['importadas'] else 200
+
+@despesas_bp.route("/status", methods=["PUT"])
+@jwt_required()
+@admin_obrigatorio
+def atualizar_status_lote():
+    data = request.get_json() or {}
+
+    status = data.get('status')
+    if status not in ['pendente', 'pago']:
+        return jsonify({"error": "Status inválido"}), 400
+
+    # Seleção por lista de ids, por fatura de cartão (cartao_id + mes/ano) ou por intervalo de vencimento
+    filtros = []
+    try:
+        if data.get('ids'):
+            filtros.append(Despesa.id.in_([int(id) for id in data['ids']]))
+        elif data.get('cartao_id'):
+            cartao = Cartao.query.get(int(data['cartao_id']))
+            if not cartao:
+                return jsonify({"error": "Cartão não encontrado"}), 404
+            inicio, fim = intervalo_fatura(cartao.dia_fechamento, int(data['ano']), int(data['mes']))
+            filtros += [
+                Despesa.cartao_id == cartao.id,
+                Despesa.data_compra > inicio,
+                Despesa.data_compra <= fim
+            ]
+        elif data.get('vencimento_inicio') and data.get('vencimento_fim'):
+            filtros += [
+                Despesa.data_vencimento >= datetime.fromisoformat(data['vencimento_inicio']).date(),
+                Despesa.data_vencimento <= datetime.fromisoformat(data['vencimento_fim']).date()
+            ]
+        else:
+            return jsonify({"error": "Informe ids, cartao_id com mes/ano ou vencimento_inicio/vencimento_fim"}), 400
+    except (KeyError, ValueError, TypeError) as e:
+        return jsonify({"error": f"Erro nos dados: {e}"}), 400
+
+    ids = atualizar_status_em_lote(filtros, status)
+    db.session.commit()
+
+    return jsonify({"atualizadas": len(ids), "ids": ids}), 200
+
+@despesas_bp.route("/<int:id>/expandir", methods=["POST"])
+@jwt_required()
+def expandir_despesa_serie(id):
+    usuario_id = get_jwt_identity()
+
+    despesa = Despesa.query.get(id)
+
+    if not despesa:
+        return jsonify({"error": "Despesa não encontrada"}), 404
+
+    if not eh_admin() and despesa.pago_por_id != int(usuario_id):
+        return jsonify({"error": "Permissão negada"}), 403
+
+    data = request.get_json(silent=True) or {}
+    try:
+        quantidade = int(data['quantidade']) if data.get('quantidade') else None
+        ids = expandir_despesa(despesa, quantidade)
+    except (ValueError, TypeError) as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 400
+
+    db.session.commit()
+    return jsonify({"despesa_pai_id": despesa.id, "criadas": len(ids), "ids": ids}), 201
+
+@despesas_bp.route("/<int:id>/familia", methods=["GET"])
+@jwt_required()
+@com_etag('despesas', 'categorias', 'cartoes', 'usuarios')
+def obter_familia_despesa(id):
+    usuario_id = get_jwt_identity()
+
+    despesas = familia_despesa(id)
+    if not despesas:
+        return jsonify({"error": "Despesa não encontrada"}), 404
+
+    if not eh_admin() and despesas[0].pago_por_id != int(usuario_id):
+        return jsonify({"error": "Permissão negada"}), 403
+
+    return jsonify(resumo_familia(despesas, id)), 200
+
+@despesas_bp.route("/ocorrencias", methods=["GET"])
+@jwt_required()
+@com_etag('despesas', 'cartoes')
+def listar_ocorrencias():
+    try:
+        inicio = datetime.fromisoformat(request.args['inicio']).date()
+        fim = datetime.fromisoformat(request.args['fim']).date()
+    except (KeyError, ValueError):
+        return jsonify({"error": "Informe inicio e fim no formato AAAA-MM-DD"}), 400
+
+    if fim < inicio:
+        return jsonify({"error": "Data final anterior à inicial"}), 400
+    if (fim.year - inicio.year) * 12 + fim.month - inicio.month >= MAXIMO_ANOS_OCORRENCIAS * 12:
+        return jsonify({"error": f"Intervalo máximo de {MAXIMO_ANOS_OCORRENCIAS} anos"}), 400
+
+    # Quem não é admin só vê as séries que paga
+    dono_id = None if eh_admin() else int(get_jwt_identity())
+    return jsonify(ocorrencias_virtuais(inicio, fim, dono_id)), 200
 
 @despesas_bp.route("/<int:id>", methods=["PUT"])
 @jwt_required()
 def atualizar_despesa(id):
     usuario_id = get_jwt_identity()
+
     despesa = Despesa.query.get(id)
 
     if not despesa:
         return jsonify({"error": "Despesa não encontrada"}), 404
 
-    usuario = Usuario.query.get(int(usuario_id))
-    if usuario.tipo != 'admin' and despesa.usuario_id != int(usuario_id):
+    if not eh_admin() and despesa.usuario_id != int(usuario_id):
         return jsonify({"error": "Permissão negada"}), 403
 
     data = request.get_json()
+    em_aberto_antes = despesa.valor_total if despesa.status != 'pago' else 0
 
     if 'descricao' in data:
         despesa.descricao = data['descricao']
@@ -175,20 +400,29 @@ def atualizar_despesa(id):
     if 'observacao' in data:
         despesa.observacao = data['observacao']
 
+    em_aberto_depois = despesa.valor_total if despesa.status != 'pago' else 0
+    erro_limite, aviso_limite = verificar_limite(despesa.cartao_id, em_aberto_depois - em_aberto_antes)
+    if erro_limite:
+        db.session.rollback()
+        return jsonify({"error": erro_limite}), 400
+
     db.session.commit()
-    return jsonify(despesa.to_dict()), 200
+    resposta = despesa.to_dict()
+    if aviso_limite:
+        resposta['aviso_limite'] = aviso_limite
+    return jsonify(resposta), 200
 
 @despesas_bp.route("/<int:id>", methods=["DELETE"])
 @jwt_required()
 def excluir_despesa(id):
     usuario_id = get_jwt_identity()
+
     despesa = Despesa.query.get(id)
 
     if not despesa:
         return jsonify({"error": "Despesa não encontrada"}), 404
 
-    usuario = Usuario.query.get(int(usuario_id))
-    if usuario.tipo != 'admin' and despesa.usuario_id != int(usuario_id):
+    if not eh_admin() and despesa.usuario_id != int(usuario_id):
         return jsonify({"error": "Permissão negada"}), 403
 
     db.session.delete(despesa)
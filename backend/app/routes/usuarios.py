@@ -1,21 +1,21 @@
 from flask import Blueprint, jsonify, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app.models.usuario import Usuario
+from app.utils.saldos import saldos_investidores
+from app.utils.cache import em_cache
+from app.utils.autorizacao import admin_obrigatorio, eh_admin, identidades
+from app.utils.etag import com_etag
 from app import db
 from werkzeug.security import generate_password_hash
+from datetime import datetime
 
 usuarios_bp = Blueprint('usuarios', __name__)
 
 @usuarios_bp.route('/', methods=['GET'])
 @jwt_required()
+@admin_obrigatorio
+@com_etag('usuarios')
 def listar_usuarios():
-    usuario_id = get_jwt_identity()
-    usuario = Usuario.query.get(int(usuario_id))
-    
-    # Verificar se é admin
-    if usuario.tipo != 'admin':
-        return jsonify({'error': 'Permissão negada'}), 403
-    
     # Parâmetros de filtro com validação segura
     tipo = request.args.get('tipo')
     tipo = tipo if tipo and tipo.strip() else None
@@ -40,12 +40,12 @@ def listar_usuarios():
 
 @usuarios_bp.route('/<int:id>', methods=['GET'])
 @jwt_required()
+@com_etag('usuarios')
 def obter_usuario(id):
     usuario_id = get_jwt_identity()
-    usuario_atual = Usuario.query.get(int(usuario_id))
     
     # Verificar permissão
-    if usuario_atual.tipo != 'admin' and int(usuario_id) != id:
+    if not eh_admin() and int(usuario_id) != id:
         return jsonify({'error': 'Permissão negada'}), 403
     
     usuario = Usuario.query.get(id)
@@ -56,14 +56,8 @@ def obter_usuario(id):
 
 @usuarios_bp.route('/', methods=['POST'])
 @jwt_required()
+@admin_obrigatorio
 def criar_usuario():
-    usuario_id = get_jwt_identity()
-    usuario_atual = Usuario.query.get(int(usuario_id))
-    
-    # Verificar se é admin
-    if usuario_atual.tipo != 'admin':
-        return jsonify({'error': 'Permissão negada'}), 403
-    
     data = request.get_json()
     
     # Validar dados obrigatórios
@@ -94,6 +88,7 @@ def criar_usuario():
     
     db.session.add(novo_usuario)
     db.session.commit()
+    identidades.invalidar()
     
     return jsonify(novo_usuario.to_dict()), 201
 
@@ -101,10 +96,9 @@ def criar_usuario():
 @jwt_required()
 def atualizar_usuario(id):
     usuario_id = get_jwt_identity()
-    usuario_atual = Usuario.query.get(int(usuario_id))
     
     # Verificar permissão
-    if usuario_atual.tipo != 'admin' and int(usuario_id) != id:
+    if not eh_admin() and int(usuario_id) != id:
         return jsonify({'error': 'Permissão negada'}), 403
     
     usuario = Usuario.query.get(id)
@@ -127,7 +121,7 @@ def atualizar_usuario(id):
         usuario.senha_hash = generate_password_hash(data['senha'])
     
     # Apenas admin pode alterar tipo e status ativo
-    if usuario_atual.tipo == 'admin':
+    if eh_admin():
         if 'tipo' in data:
             if data['tipo'] not in ['admin', 'investidor']:
                 return jsonify({'error': 'Tipo de usuário inválido'}), 400
@@ -137,18 +131,15 @@ def atualizar_usuario(id):
             usuario.ativo = data['ativo']
     
     db.session.commit()
+    identidades.invalidar()
     
     return jsonify(usuario.to_dict()), 200
 
 @usuarios_bp.route('/<int:id>', methods=['DELETE'])
 @jwt_required()
+@admin_obrigatorio
 def excluir_usuario(id):
     usuario_id = get_jwt_identity()
-    usuario_atual = Usuario.query.get(int(usuario_id))
-    
-    # Verificar se é admin
-    if usuario_atual.tipo != 'admin':
-        return jsonify({'error': 'Permissão negada'}), 403
     
     # Não permitir excluir a si mesmo
     if int(usuario_id) == id:
@@ -163,6 +154,7 @@ def excluir_usuario(id):
         # Em vez de excluir, desativar
         usuario.ativo = False
         db.session.commit()
+        identidades.invalidar()
         return jsonify({
             'message': 'Usuário desativado pois possui registros associados',
             'desativado': True
@@ -170,38 +162,33 @@ def excluir_usuario(id):
     
     db.session.delete(usuario)
     db.session.commit()
+    identidades.invalidar()
     
     return jsonify({'message': 'Usuário excluído com sucesso'}), 200
 
 @usuarios_bp.route('/saldos', methods=['GET'])
 @jwt_required()
+@com_etag('usuarios', 'aportes', 'despesas')
+@em_cache('usuarios', 'aportes', 'despesas')
 def saldos_usuarios():
-    # Obter todos os usuários investidores ativos
-    usuarios = Usuario.query.filter_by(tipo='investidor', ativo=True).all()
-    
-    saldos = []
-    for usuario in usuarios:
-        # Total de aportes
-        total_aportes = sum(aporte.valor for aporte in usuario.aportes)
-        
-        # Total de despesas pagas pelo usuário
-        total_despesas_pagas = sum(despesa.valor_total for despesa in usuario.despesas_pagas)
-        
-        # Total de despesas divididas (valor dividido por investidor)
-        total_despesas_divididas = db.session.query(
-            db.func.sum(Despesa.valor_dividido)
-        ).filter(Despesa.status == 'pago').scalar() or 0
-        
-        # Calcular saldo
-        saldo = total_aportes - total_despesas_divididas
-        
-        # Adicionar à lista
-        saldos.append({
-            'usuario': usuario.to_dict(),
-            'total_aportes': total_aportes,
-            'total_despesas_pagas': total_despesas_pagas,
-            'total_despesas_divididas': total_despesas_divididas,
-            'saldo': saldo
-        })
+    # Data de referência opcional para o saldo (padrão: saldo atual)
+    data_str = request.args.get('data')
+    data_referencia = None
+    if data_str:
+        try:
+            data_referencia = datetime.fromisoformat(data_str).date()
+        except ValueError:
+            return jsonify({'error': 'Formato de data inválido'}), 400
+    
+    saldos = [
+        {
+            'usuario': saldo['usuario'].to_dict(),
+            'total_aportes': saldo['total_aportes'],
+            'total_despesas_pagas': saldo['total_despesas_pagas'],
+            'total_despesas_divididas': saldo['total_despesas_divididas'],
+            'saldo': saldo['saldo']
+        }
+        for saldo in saldos_investidores(data_referencia)
+    ]
     
     return jsonify(saldos), 200
@@ -0,0 +1,186 @@
+from app import db
+from app.models.total_mensal import TotalMensal
+from app.models.categoria import Categoria
+from app.models.usuario import Usuario
+
+
+def _filtro_meses(meses):
+    """Restringe totais_mensais ao intervalo [primeiro, último] de uma lista (ano, mes) ordenada"""
+    ano_inicio, mes_inicio = meses[0]
+    ano_fim, mes_fim = meses[-1]
+    return [
+        db.or_(
+            TotalMensal.ano > ano_inicio,
+            db.and_(TotalMensal.ano == ano_inicio, TotalMensal.mes >= mes_inicio)
+        ),
+        db.or_(
+            TotalMensal.ano < ano_fim,
+            db.and_(TotalMensal.ano == ano_fim, TotalMensal.mes <= mes_fim)
+        )
+    ]
+
+
+def resumo_despesas_mes(ano, mes):
+    """Totaliza as despesas com vencimento no mês numa única consulta agrupada sobre totais_mensais"""
+
+    linhas = db.session.query(
+        TotalMensal.categoria_id,
+        TotalMensal.status,
+        db.func.coalesce(db.func.sum(TotalMensal.total), 0),
+        Categoria.nome,
+        Categoria.descricao,
+        Categoria.cor,
+        Categoria.data_criacao
+    ).join(
+        Categoria, Categoria.id == TotalMensal.categoria_id
+    ).filter(
+        TotalMensal.origem == 'despesa',
+        TotalMensal.ano == ano,
+        TotalMensal.mes == mes
+    ).group_by(
+        TotalMensal.categoria_id,
+        TotalMensal.status,
+        Categoria.nome,
+        Categoria.descricao,
+        Categoria.cor,
+        Categoria.data_criacao
+    ).all()
+
+    total = 0
+    total_pago = 0
+    total_pendente = 0
+    por_categoria = {}
+
+    for categoria_id, status, soma, nome, descricao, cor, data_criacao in linhas:
+        total += soma
+        if status == 'pago':
+            total_pago += soma
+        elif status == 'pendente':
+            total_pendente += soma
+
+        if categoria_id not in por_categoria:
+            por_categoria[categoria_id] = {
+                'categoria': {
+                    'id': categoria_id,
+                    'nome': nome,
+                    'descricao': descricao,
+                    'cor': cor,
+                    'data_criacao': data_criacao.isoformat() if data_criacao else None
+                },
+                'total': 0
+            }
+        por_categoria[categoria_id]['total'] += soma
+
+    return {
+        'total': total,
+        'total_pago': total_pago,
+        'total_pendente': total_pendente,
+        'por_categoria': list(por_categoria.values())
+    }
+
+
+def total_aportes_mes(ano, mes):
+    """Soma os aportes do mês a partir de totais_mensais"""
+
+    return db.session.query(
+        db.func.coalesce(db.func.sum(TotalMensal.total), 0)
+    ).filter(
+        TotalMensal.origem == 'aporte',
+        TotalMensal.ano == ano,
+        TotalMensal.mes == mes
+    ).scalar()
+
+
+def intervalo_meses(ano, mes, quantidade):
+    """Lista (ano, mes) dos últimos `quantidade` meses até ano/mes, em ordem cronológica"""
+
+    indice_final = ano * 12 + (mes - 1)
+    return [
+        (indice // 12, indice % 12 + 1)
+        for indice in range(indice_final - quantidade + 1, indice_final + 1)
+    ]
+
+
+def serie_mensal(origem, meses):
+    """Soma totais_mensais por mês para a origem (despesa/aporte), preenchendo meses vazios"""
+
+    if not meses:
+        return []
+
+    linhas = db.session.query(
+        TotalMensal.ano,
+        TotalMensal.mes,
+        db.func.sum(TotalMensal.total)
+    ).filter(
+        TotalMensal.origem == origem,
+        *_filtro_meses(meses)
+    ).group_by(TotalMensal.ano, TotalMensal.mes).all()
+
+    totais = {(ano, mes): total or 0 for ano, mes, total in linhas}
+
+    return [
+        {'mes': mes, 'ano': ano, 'total': totais.get((ano, mes), 0)}
+        for ano, mes in meses
+    ]
+
+
+def totais_aportes_periodo(ano_inicio, ano_fim, usuario_id=None):
+    """Total geral, por usuário, por mês e matriz usuário x mês dos aportes entre os anos informados
+
+    Uma consulta agrupada por (usuário, ano, mês) sobre totais_mensais; os demais totais saem dela.
+    """
+
+    filtros = [
+        TotalMensal.origem == 'aporte',
+        TotalMensal.ano >= ano_inicio,
+        TotalMensal.ano <= ano_fim
+    ]
+    if usuario_id:
+        filtros.append(TotalMensal.usuario_id == usuario_id)
+
+    linhas = db.session.query(
+        TotalMensal.usuario_id,
+        TotalMensal.ano,
+        TotalMensal.mes,
+        db.func.sum(TotalMensal.total)
+    ).filter(*filtros).group_by(
+        TotalMensal.usuario_id, TotalMensal.ano, TotalMensal.mes
+    ).all()
+
+    meses = intervalo_meses(ano_fim, 12, (ano_fim - ano_inicio + 1) * 12)
+    posicao = {chave: indice for indice, chave in enumerate(meses)}
+
+    por_usuario = {}
+    por_mes = {}
+    matriz = {}
+    for linha_usuario, ano, mes, total in linhas:
+        total = total or 0
+        por_usuario[linha_usuario] = por_usuario.get(linha_usuario, 0) + total
+        por_mes[(ano, mes)] = por_mes.get((ano, mes), 0) + total
+        matriz.setdefault(linha_usuario, [0] * len(meses))[posicao[(ano, mes)]] += total
+
+    usuarios = {
+        usuario.id: usuario
+        for usuario in Usuario.query.filter(Usuario.id.in_(list(por_usuario)))
+    } if por_usuario else {}
+
+    return {
+        'ano_inicio': ano_inicio,
+        'ano_fim': ano_fim,
+        'total_geral': sum(por_usuario.values()),
+        'totais_por_usuario': [
+            {'usuario': usuarios[id].to_dict(), 'total': total}
+            for id, total in por_usuario.items()
+            if id in usuarios
+        ],
+        'totais_por_mes': [
+            {'ano': ano, 'mes': mes, 'total': por_mes[(ano, mes)]}
+            for ano, mes in meses
+            if (ano, mes) in por_mes
+        ],
+        'meses': [{'ano': ano, 'mes': mes} for ano, mes in meses],
+        'matriz': [
+            {'usuario_id': id, 'totais': valores}
+            for id, valores in sorted(matriz.items())
+        ]
+    }
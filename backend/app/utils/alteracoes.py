@@ -0,0 +1,121 @@
+from collections import namedtuple
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+from app.models.despesa import Despesa
+from app.models.aporte import Aporte
+
+# Atributos acompanhados em cada modelo; observadores recebem seus valores antes e depois do flush
+CAMPOS_MONITORADOS = {
+    Despesa: [
+        'data_vencimento', 'categoria_id', 'status', 'pago_por_id', 'valor_total', 'valor_dividido',
+        'descricao', 'origem', 'cartao_id', 'data_compra'
+    ],
+    Aporte: ['data', 'usuario_id', 'valor', 'observacao']
+}
+
+CHAVE_PENDENTE = 'alteracoes_anteriores'
+
+# anterior/atual: dicionários com os campos monitorados, ou None para inclusão/exclusão
+Alteracao = namedtuple('Alteracao', ['modelo', 'id', 'anterior', 'atual'])
+
+_observadores = []
+
+
+def observar_alteracoes(funcao):
+    """Registra funcao(conexao, alteracoes) para ser chamada ao fim de cada flush com alterações"""
+    _observadores.append(funcao)
+    return funcao
+
+
+def _campos(obj):
+    return CAMPOS_MONITORADOS.get(type(obj))
+
+
+def _valores_atuais(obj):
+    return {campo: getattr(obj, campo) for campo in _campos(obj)}
+
+
+def _valores_anteriores(session, obj):
+    """Valores persistidos antes do flush, recorrendo ao banco se algum atributo expirou"""
+    estado = inspect(obj)
+    valores = {}
+    faltando = False
+
+    for campo in _campos(obj):
+        historico = estado.attrs[campo].history
+        if historico.deleted:
+            valores[campo] = historico.deleted[0]
+        elif historico.unchanged:
+            valores[campo] = historico.unchanged[0]
+        else:
+            faltando = True
+
+    if faltando:
+        modelo = type(obj)
+        colunas = [getattr(modelo, campo) for campo in _campos(obj)]
+        linha = session.connection().execute(
+            select(*colunas).where(modelo.id == estado.identity[0])
+        ).first()
+        if linha is None:
+            return None
+        valores = dict(zip(_campos(obj), linha))
+
+    return valores
+
+
+@event.listens_for(Session, 'before_flush')
+def _capturar_valores_anteriores(session, flush_context, instances):
+    """Guarda o estado persistido dos registros monitorados que serão alterados ou excluídos"""
+    anteriores = []
+
+    for obj in list(session.dirty) + list(session.deleted):
+        campos = _campos(obj)
+        if campos is None or obj in session.new:
+            continue
+        estado = inspect(obj)
+        if obj not in session.deleted and not any(
+            estado.attrs[campo].history.has_changes() for campo in campos
+        ):
+            continue
+        valores = _valores_anteriores(session, obj)
+        if valores is not None:
+            anteriores.append((obj, valores))
+
+    session.info[CHAVE_PENDENTE] = anteriores
+
+
+@event.listens_for(Session, 'after_flush')
+def _notificar_observadores(session, flush_context):
+    """Entrega aos observadores o estado anterior e o novo de cada registro monitorado"""
+    anteriores = session.info.pop(CHAVE_PENDENTE, [])
+    alteracoes = []
+
+    for obj, valores in anteriores:
+        atual = None if obj in session.deleted else _valores_atuais(obj)
+        alteracoes.append(Alteracao(type(obj), obj.id, valores, atual))
+
+    for obj in session.new:
+        if _campos(obj) is not None:
+            alteracoes.append(Alteracao(type(obj), obj.id, None, _valores_atuais(obj)))
+
+    if alteracoes:
+        notificar_alteracoes(session.connection(), alteracoes)
+
+
+def notificar_alteracoes(conexao, alteracoes):
+    """Repassa alterações aos observadores; usado também por escritas em massa fora do ORM"""
+    for observador in _observadores:
+        observador(conexao, alteracoes)
+
+
+def inserir_em_massa(conexao, modelo, linhas):
+    """INSERT com executemany fora do ORM, notificando os observadores das inclusões; retorna os ids"""
+    tabela = modelo.__table__
+    ids = conexao.execute(tabela.insert().returning(tabela.c.id), linhas).scalars().all()
+
+    campos = CAMPOS_MONITORADOS[modelo]
+    notificar_alteracoes(conexao, [
+        Alteracao(modelo, id, None, {campo: linha.get(campo) for campo in campos})
+        for id, linha in zip(ids, linhas)
+    ])
+    return ids
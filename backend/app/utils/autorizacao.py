@@ -0,0 +1,103 @@
+import threading
+import time
+from functools import wraps
+from flask import jsonify
+from flask_jwt_extended import get_jwt, get_jwt_identity
+from app import db, jwt
+from app.models.usuario import Usuario
+
+# Tempo máximo até uma desativação ou troca de papel feita em outro processo valer para tokens já emitidos
+TTL_IDENTIDADES = 30
+
+
+def claims_usuario(usuario):
+    """Claim adicional assinada no token: papel do usuário no momento do login
+
+    A situação (ativo) não vai no token: o login só emite tokens para usuários ativos e
+    _token_valido confere a situação atual pelo cache de identidades.
+    """
+    return {'tipo': usuario.tipo}
+
+
+class CacheIdentidades:
+    """(tipo, ativo) de todos os usuários, recarregado numa única consulta a cada TTL_IDENTIDADES segundos"""
+
+    def __init__(self, ttl=TTL_IDENTIDADES):
+        self.ttl = ttl
+        self._usuarios = {}
+        self._expira_em = 0
+        self._lock = threading.Lock()
+
+    def obter(self, usuario_id):
+        with self._lock:
+            if self._expira_em > time.monotonic():
+                if usuario_id in self._usuarios:
+                    return self._usuarios[usuario_id]
+                recarregar = False
+            else:
+                recarregar = True
+
+        if not recarregar:
+            # Usuário criado depois da última carga: só é ausente se o banco confirmar
+            linha = db.session.query(Usuario.tipo, Usuario.ativo).filter(Usuario.id == usuario_id).first()
+            if linha is None:
+                return None
+            situacao = (linha.tipo, bool(linha.ativo))
+            with self._lock:
+                self._usuarios[usuario_id] = situacao
+            return situacao
+
+        usuarios = {
+            id: (tipo, bool(ativo))
+            for id, tipo, ativo in db.session.query(Usuario.id, Usuario.tipo, Usuario.ativo)
+        }
+        with self._lock:
+            self._usuarios = usuarios
+            self._expira_em = time.monotonic() + self.ttl
+        return usuarios.get(usuario_id)
+
+    def invalidar(self):
+        """Força a recarga na próxima consulta; usado após alterar usuários neste processo"""
+        with self._lock:
+            self._expira_em = 0
+
+
+identidades = CacheIdentidades()
+
+
+@jwt.token_verification_loader
+def _token_valido(cabecalho, dados):
+    """Recusa tokens de usuários excluídos, desativados ou cujo papel mudou depois do login"""
+    situacao = identidades.obter(int(dados['sub']))
+    if situacao is None or not situacao[1]:
+        return False
+    tipo = dados.get('tipo')
+    return tipo is None or tipo == situacao[0]
+
+
+@jwt.token_verification_failed_loader
+def _token_recusado(cabecalho, dados):
+    return jsonify({'error': 'Sessão inválida; faça login novamente'}), 401
+
+
+def papel_atual():
+    """Papel do usuário autenticado lido das claims do token (tokens antigos recorrem ao cache)"""
+    tipo = get_jwt().get('tipo')
+    if tipo is None:
+        situacao = identidades.obter(int(get_jwt_identity()))
+        tipo = situacao[0] if situacao else None
+    return tipo
+
+
+def eh_admin():
+    return papel_atual() == 'admin'
+
+
+def admin_obrigatorio(funcao):
+    """Responde 403 a quem não é admin; usar abaixo de @jwt_required()"""
+    @wraps(funcao)
+    def envoltorio(*args, **kwargs):
+        if not eh_admin():
+            return jsonify({'error': 'Permissão negada'}), 403
+        return funcao(*args, **kwargs)
+    return envoltorio
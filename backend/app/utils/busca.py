@@ -0,0 +1,246 @@
+import re
+from sqlalchemy import inspect, text
+from sqlalchemy.orm import joinedload
+from app import db
+from app.models.despesa import Despesa
+from app.models.aporte import Aporte
+from app.utils.alteracoes import observar_alteracoes
+from app.utils.carregamento import opcoes_serializacao_despesa
+
+# Índice textual único para descrições de despesas e observações de aportes:
+# FTS5 no SQLite e tsvector com índice GIN no PostgreSQL
+TABELA_BUSCA = 'indice_busca'
+
+TIPOS = {'despesa': Despesa, 'aporte': Aporte}
+
+# Coluna que identifica o dono de cada registro, para restringir a busca de quem não é admin
+DONOS = {'despesa': Despesa.pago_por_id, 'aporte': Aporte.usuario_id}
+
+_indice_criado = set()
+
+
+def _dialeto(conexao):
+    return conexao.dialect.name
+
+
+def _rowid(tipo, registro_id):
+    """rowid da linha no FTS5: colunas UNINDEXED não têm índice, então as remoções localizam a linha pelo rowid"""
+    return registro_id * len(TIPOS) + list(TIPOS).index(tipo)
+
+
+def _texto_indexado(modelo, valores):
+    if valores is None:
+        return None
+    if modelo is Despesa:
+        partes = [valores.get('descricao'), valores.get('origem')]
+    else:
+        partes = [valores.get('observacao')]
+    texto = ' '.join(parte for parte in partes if parte)
+    return texto or None
+
+
+def configurar_busca(conexao):
+    """Cria a estrutura do índice textual para o banco em uso (idempotente); retorna True se ela acabou de ser criada"""
+    if _dialeto(conexao) not in ('sqlite', 'postgresql'):
+        return False
+
+    if inspect(conexao).has_table(TABELA_BUSCA):
+        return False
+
+    if _dialeto(conexao) == 'sqlite':
+        conexao.execute(text(
+            f"CREATE VIRTUAL TABLE {TABELA_BUSCA} USING fts5("
+            "texto, tipo UNINDEXED, registro_id UNINDEXED, tokenize='unicode61 remove_diacritics 2')"
+        ))
+    else:
+        conexao.execute(text(
+            f"CREATE TABLE {TABELA_BUSCA} ("
+            "tipo VARCHAR(20) NOT NULL, registro_id INTEGER NOT NULL, texto TEXT NOT NULL, "
+            "documento TSVECTOR GENERATED ALWAYS AS (to_tsvector('portuguese', texto)) STORED, "
+            "PRIMARY KEY (tipo, registro_id))"
+        ))
+        conexao.execute(text(
+            f"CREATE INDEX ix_{TABELA_BUSCA}_documento ON {TABELA_BUSCA} USING GIN (documento)"
+        ))
+    return True
+
+
+def busca_disponivel(conexao):
+    """Indica se o índice textual existe no banco; sem ele as rotas recorrem a ILIKE"""
+    chave = str(conexao.engine.url)
+    if chave in _indice_criado:
+        return True
+    if _dialeto(conexao) in ('sqlite', 'postgresql') and inspect(conexao).has_table(TABELA_BUSCA):
+        _indice_criado.add(chave)
+        return True
+    return False
+
+
+def _remover(conexao, tipo, registro_id):
+    if _dialeto(conexao) == 'sqlite':
+        conexao.execute(
+            text(f"DELETE FROM {TABELA_BUSCA} WHERE rowid = :rowid"),
+            {'rowid': _rowid(tipo, registro_id)}
+        )
+    else:
+        # (tipo, registro_id) é a chave primária no PostgreSQL
+        conexao.execute(
+            text(f"DELETE FROM {TABELA_BUSCA} WHERE tipo = :tipo AND registro_id = :registro_id"),
+            {'tipo': tipo, 'registro_id': registro_id}
+        )
+
+
+def _inserir(conexao, linhas):
+    if _dialeto(conexao) == 'sqlite':
+        conexao.execute(
+            text(f"INSERT INTO {TABELA_BUSCA} (rowid, texto, tipo, registro_id) VALUES (:rowid, :texto, :tipo, :registro_id)"),
+            [{**linha, 'rowid': _rowid(linha['tipo'], linha['registro_id'])} for linha in linhas]
+        )
+    else:
+        conexao.execute(
+            text(f"INSERT INTO {TABELA_BUSCA} (texto, tipo, registro_id) VALUES (:texto, :tipo, :registro_id)"),
+            linhas
+        )
+
+
+@observar_alteracoes
+def _sincronizar_busca(conexao, alteracoes):
+    """Mantém o índice textual igual às descrições/observações gravadas"""
+    if not busca_disponivel(conexao):
+        return
+
+    novas = []
+    for alteracao in alteracoes:
+        anterior = _texto_indexado(alteracao.modelo, alteracao.anterior)
+        atual = _texto_indexado(alteracao.modelo, alteracao.atual)
+        if alteracao.anterior is not None and anterior == atual:
+            continue
+
+        tipo = 'despesa' if alteracao.modelo is Despesa else 'aporte'
+        if alteracao.anterior is not None:
+            _remover(conexao, tipo, alteracao.id)
+        if atual:
+            novas.append({'texto': atual, 'tipo': tipo, 'registro_id': alteracao.id})
+
+    if novas:
+        _inserir(conexao, novas)
+
+
+def reconstruir_busca():
+    """Recria o índice textual a partir de despesas e aportes"""
+    conexao = db.session.connection()
+    configurar_busca(conexao)
+    conexao.execute(text(f"DELETE FROM {TABELA_BUSCA}"))
+
+    total = 0
+    consultas = [
+        ('despesa', db.session.query(Despesa.id, Despesa.descricao, Despesa.origem)),
+        ('aporte', db.session.query(Aporte.id, Aporte.observacao))
+    ]
+    for tipo, consulta in consultas:
+        lote = []
+        for linha in consulta.yield_per(1000):
+            texto_linha = ' '.join(parte for parte in linha[1:] if parte)
+            if texto_linha:
+                lote.append({'texto': texto_linha, 'tipo': tipo, 'registro_id': linha[0]})
+            if len(lote) >= 1000:
+                _inserir(conexao, lote)
+                total += len(lote)
+                lote = []
+        if lote:
+            _inserir(conexao, lote)
+            total += len(lote)
+
+    db.session.commit()
+    return total
+
+
+def _consulta_fts5(termo):
+    """Converte o texto digitado em uma consulta FTS5 segura: todos os termos, por prefixo"""
+    palavras = re.findall(r'\w+', termo, flags=re.UNICODE)
+    return ' '.join(f'"{palavra}"*' for palavra in palavras)
+
+
+def _condicao_e_rank(conexao):
+    if _dialeto(conexao) == 'sqlite':
+        return f"{TABELA_BUSCA} MATCH :consulta", f"bm25({TABELA_BUSCA})"
+    return (
+        "documento @@ websearch_to_tsquery('portuguese', :consulta)",
+        "-ts_rank(documento, websearch_to_tsquery('portuguese', :consulta))"
+    )
+
+
+def _parametro_consulta(conexao, termo):
+    return _consulta_fts5(termo) if _dialeto(conexao) == 'sqlite' else termo
+
+
+def ids_correspondentes(tipo, termo):
+    """Subconsulta com os ids do tipo cujo texto corresponde ao termo, para usar em filtros IN
+
+    Termo sem nenhuma palavra (só pontuação) não corresponde a nada: retorna lista vazia.
+    """
+    conexao = db.session.connection()
+    consulta = _parametro_consulta(conexao, termo)
+    if not consulta:
+        return []
+
+    condicao, _ = _condicao_e_rank(conexao)
+    return text(
+        f"SELECT registro_id FROM {TABELA_BUSCA} WHERE {condicao} AND tipo = :tipo_busca"
+    ).bindparams(consulta=consulta, tipo_busca=tipo).columns(registro_id=db.Integer)
+
+
+def _condicao_tipo(indice, tipo, dono_id):
+    if dono_id is None:
+        return f"tipo = :tipo_{indice}"
+    coluna = DONOS[tipo]
+    return (
+        f"(tipo = :tipo_{indice} AND registro_id IN "
+        f"(SELECT id FROM {coluna.table.name} WHERE {coluna.name} = :dono_id))"
+    )
+
+
+def buscar(termo, tipos=None, page=1, per_page=20, dono_id=None):
+    """Resultados ordenados por relevância, paginados, com os registros já carregados
+
+    Com `dono_id`, só entram despesas pagas e aportes feitos por esse usuário.
+    """
+    conexao = db.session.connection()
+    tipos = tipos or list(TIPOS)
+    consulta = _parametro_consulta(conexao, termo)
+    if not consulta:
+        return []
+
+    condicao, rank = _condicao_e_rank(conexao)
+    acertos = conexao.execute(
+        text(
+            f"SELECT tipo, registro_id, {rank} AS relevancia FROM {TABELA_BUSCA} "
+            f"WHERE {condicao} AND ({' OR '.join(_condicao_tipo(i, tipo, dono_id) for i, tipo in enumerate(tipos))}) "
+            "ORDER BY relevancia LIMIT :limite OFFSET :deslocamento"
+        ),
+        {
+            'consulta': consulta,
+            'limite': per_page,
+            'deslocamento': (page - 1) * per_page,
+            'dono_id': dono_id,
+            **{f'tipo_{i}': tipo for i, tipo in enumerate(tipos)}
+        }
+    ).all()
+
+    # Uma consulta por tipo para carregar os registros encontrados
+    registros = {}
+    for tipo, modelo in TIPOS.items():
+        ids = [registro_id for tipo_acerto, registro_id, _ in acertos if tipo_acerto == tipo]
+        if ids:
+            if modelo is Despesa:
+                consulta_modelo = Despesa.query.options(*opcoes_serializacao_despesa())
+            else:
+                consulta_modelo = Aporte.query.options(joinedload(Aporte.usuario))
+            for registro in consulta_modelo.filter(modelo.id.in_(ids)):
+                registros[(tipo, registro.id)] = registro
+
+    return [
+        {'tipo': tipo, 'relevancia': -relevancia, 'item': registros[(tipo, registro_id)].to_dict()}
+        for tipo, registro_id, relevancia in acertos
+        if (tipo, registro_id) in registros
+    ]
@@ -0,0 +1,70 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from functools import wraps
+from flask import Response, make_response, request
+from app.utils.autorizacao import papel_atual
+from app.utils.versoes import versao_de
+
+
+class CacheRespostas:
+    """Cache LRU com expiração por tempo, seguro para uso entre threads"""
+
+    def __init__(self, capacidade=256, ttl=300):
+        self.capacidade = capacidade
+        self.ttl = ttl
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obter(self, chave):
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None:
+                return None
+            expira_em, valor = item
+            if expira_em < time.monotonic():
+                del self._itens[chave]
+                return None
+            self._itens.move_to_end(chave)
+            return valor
+
+    def guardar(self, chave, valor):
+        with self._lock:
+            self._itens[chave] = (time.monotonic() + self.ttl, valor)
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.capacidade:
+                self._itens.popitem(last=False)
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+
+
+cache_respostas = CacheRespostas()
+
+def em_cache(*tabelas):
+    """Guarda a resposta da rota por (endpoint, parâmetros, papel do usuário, versões das tabelas)"""
+    def decorador(funcao):
+        @wraps(funcao)
+        def envoltorio(*args, **kwargs):
+            chave = (
+                request.endpoint,
+                tuple(sorted(request.view_args.items())),
+                tuple(sorted(request.args.items(multi=True))),
+                papel_atual(),
+                versao_de(*tabelas),
+                date.today()  # Rotas usam a data atual como padrão
+            )
+
+            armazenado = cache_respostas.obter(chave)
+            if armazenado is not None:
+                corpo, status, mimetype = armazenado
+                return Response(corpo, status=status, mimetype=mimetype)
+
+            resposta = make_response(funcao(*args, **kwargs))
+            if resposta.status_code == 200:
+                cache_respostas.guardar(chave, (resposta.get_data(), resposta.status_code, resposta.mimetype))
+            return resposta
+        return envoltorio
+    return decorador
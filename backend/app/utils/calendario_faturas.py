@@ -0,0 +1,99 @@
+import calendar
+from collections import namedtuple
+from datetime import date
+from functools import lru_cache
+
+
+def data_no_mes(ano, mes, dia):
+    """date(ano, mes, dia) limitado ao último dia do mês (ex.: dia 31 em fevereiro)"""
+    return date(ano, mes, min(dia, calendar.monthrange(ano, mes)[1]))
+
+
+def mes_anterior(ano, mes):
+    return (ano - 1, 12) if mes == 1 else (ano, mes - 1)
+
+
+def intervalo_fatura(dia_fechamento, ano, mes):
+    """Compras da fatura que fecha em ano/mes: data_compra em (fechamento anterior, fechamento]"""
+    ano_anterior, mes_ant = mes_anterior(ano, mes)
+    return data_no_mes(ano_anterior, mes_ant, dia_fechamento), data_no_mes(ano, mes, dia_fechamento)
+
+
+def somar_meses(ano, mes, quantidade):
+    indice = ano * 12 + (mes - 1) + quantidade
+    return indice // 12, indice % 12 + 1
+
+
+def mes_fechamento(dia_fechamento, data_compra):
+    """(ano, mes) da fatura em que cai uma compra: compras após o fechamento vão para a fatura seguinte"""
+    if data_compra <= data_no_mes(data_compra.year, data_compra.month, dia_fechamento):
+        return data_compra.year, data_compra.month
+    return somar_meses(data_compra.year, data_compra.month, 1)
+
+
+def vencimento_fatura(dia_fechamento, dia_vencimento, ano, mes):
+    """Vencimento da fatura que fecha em ano/mes; vence no mês seguinte se o dia é anterior ao fechamento"""
+    if dia_vencimento < dia_fechamento:
+        ano, mes = somar_meses(ano, mes, 1)
+    return data_no_mes(ano, mes, dia_vencimento)
+
+
+# Ciclo de faturamento: compras com data_compra em (inicio, fechamento]
+Ciclo = namedtuple('Ciclo', ['ano', 'mes', 'inicio', 'fechamento', 'vencimento'])
+
+# Meses guardados por calendário (preenchidos sob demanda); datas fora do intervalo caem no cálculo direto
+ANO_INICIAL = 2000
+ANO_FINAL = 2100
+_MESES = (ANO_FINAL - ANO_INICIAL + 1) * 12
+
+
+def _calcular_ciclo(dia_fechamento, dia_vencimento, indice):
+    ano, mes = divmod(indice, 12)
+    ano, mes = ANO_INICIAL + ano, mes + 1
+    inicio, fechamento = intervalo_fatura(dia_fechamento, ano, mes)
+    return Ciclo(ano, mes, inicio, fechamento, vencimento_fatura(dia_fechamento, dia_vencimento, ano, mes))
+
+
+class CalendarioFaturas:
+    """Ciclos de um par (dia_fechamento, dia_vencimento) indexados por mês, com consulta O(1)"""
+
+    def __init__(self, dia_fechamento, dia_vencimento):
+        self.dia_fechamento = dia_fechamento
+        self.dia_vencimento = dia_vencimento
+        self._ciclos = [None] * _MESES
+
+    def _ciclo_no_indice(self, indice):
+        if not 0 <= indice < _MESES:
+            return _calcular_ciclo(self.dia_fechamento, self.dia_vencimento, indice)
+        ciclo = self._ciclos[indice]
+        if ciclo is None:
+            ciclo = self._ciclos[indice] = _calcular_ciclo(self.dia_fechamento, self.dia_vencimento, indice)
+        return ciclo
+
+    def ciclo(self, ano, mes):
+        """Ciclo cuja fatura fecha em ano/mes"""
+        return self._ciclo_no_indice((ano - ANO_INICIAL) * 12 + mes - 1)
+
+    def ciclo_da_data(self, data):
+        """Ciclo em que cai uma compra feita na data: o do próprio mês, ou o seguinte se já fechou"""
+        indice = (data.year - ANO_INICIAL) * 12 + data.month - 1
+        ciclo = self._ciclo_no_indice(indice)
+        if data <= ciclo.fechamento:
+            return ciclo
+        return self._ciclo_no_indice(indice + 1)
+
+    def ciclos(self, ano, mes, quantidade):
+        """`quantidade` ciclos consecutivos a partir do que fecha em ano/mes"""
+        inicio = (ano - ANO_INICIAL) * 12 + mes - 1
+        return [self._ciclo_no_indice(indice) for indice in range(inicio, inicio + quantidade)]
+
+
+# 31 x 31 combinações possíveis de dias: todas cabem no cache
+@lru_cache(maxsize=1024)
+def calendario(dia_fechamento, dia_vencimento):
+    """Calendário compartilhado por todos os cartões com os mesmos dias de fechamento e vencimento"""
+    return CalendarioFaturas(dia_fechamento, dia_vencimento)
+
+
+def calendario_cartao(cartao):
+    return calendario(cartao.dia_fechamento, cartao.dia_vencimento)
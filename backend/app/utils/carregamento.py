@@ -0,0 +1,21 @@
+from flask import current_app
+from sqlalchemy.orm import joinedload, raiseload
+from app.models.despesa import Despesa
+from app.models.cartao import Cartao
+
+
+def opcoes_serializacao_despesa():
+    """Opções de carga que trazem tudo o que Despesa.to_dict() usa na mesma consulta
+
+    Com CARREGAMENTO_ESTRITO ativo, qualquer outro lazy load levanta erro em vez de gerar
+    uma consulta extra por linha.
+    """
+    opcoes = [
+        joinedload(Despesa.categoria),
+        joinedload(Despesa.cartao).joinedload(Cartao.usuario),
+        joinedload(Despesa.cartao).joinedload(Cartao.saldo),
+        joinedload(Despesa.pago_por)
+    ]
+    if current_app.config.get('CARREGAMENTO_ESTRITO'):
+        opcoes.append(raiseload('*'))
+    return opcoes
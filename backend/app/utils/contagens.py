@@ -0,0 +1,61 @@
+import threading
+from flask import current_app
+from app import db
+
+
+class ContagensAproximadas:
+    """Totais de listagens guardados por filtro e recalculados em segundo plano quando a tabela muda
+
+    obter() nunca executa o COUNT na requisição: devolve o último total conhecido (exato se a versão
+    da tabela não mudou desde então) e, se estiver desatualizado ou ausente, agenda o recálculo.
+    """
+
+    def __init__(self, capacidade=512):
+        self.capacidade = capacidade
+        self._totais = {}
+        self._em_andamento = set()
+        self._lock = threading.Lock()
+
+    def obter(self, chave, versao, contar):
+        """(total ou None, exato) para a chave; contar() roda numa thread com contexto da aplicação"""
+        with self._lock:
+            armazenado = self._totais.get(chave)
+            if armazenado is not None and armazenado[0] == versao:
+                return armazenado[1], True
+            agendar = chave not in self._em_andamento
+            if agendar:
+                self._em_andamento.add(chave)
+
+        if agendar:
+            app = current_app._get_current_object()
+            threading.Thread(
+                target=self._recalcular, args=(app, chave, versao, contar), daemon=True
+            ).start()
+
+        return (armazenado[1] if armazenado is not None else None), False
+
+    def exato(self, chave, versao):
+        """Indica se já há total exato para a chave na versão informada, sem agendar recálculo"""
+        with self._lock:
+            armazenado = self._totais.get(chave)
+            return armazenado is not None and armazenado[0] == versao
+
+    def _recalcular(self, app, chave, versao, contar):
+        try:
+            with app.app_context():
+                try:
+                    total = contar()
+                finally:
+                    db.session.remove()
+            with self._lock:
+                if len(self._totais) >= self.capacidade and chave not in self._totais:
+                    self._totais.pop(next(iter(self._totais)))
+                self._totais[chave] = (versao, total)
+        except Exception:
+            app.logger.exception('Falha ao recalcular contagem %s', chave)
+        finally:
+            with self._lock:
+                self._em_andamento.discard(chave)
+
+
+contagens_aproximadas = ContagensAproximadas()
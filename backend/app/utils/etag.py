@@ -0,0 +1,45 @@
+import hashlib
+from datetime import date
+from functools import wraps
+from flask import Response, make_response, request
+from flask_jwt_extended import get_jwt_identity
+from app.utils.versoes import versao_de
+
+
+def calcular_etag(*tabelas, complemento=None):
+    """ETag forte da requisição atual a partir das versões das tabelas das quais a rota depende
+
+    `complemento`, se informado, é chamado para incluir no ETag estado que não vem das tabelas.
+    """
+    partes = (
+        request.endpoint,
+        tuple(sorted(request.view_args.items())),
+        tuple(sorted(request.args.items(multi=True))),
+        get_jwt_identity(),
+        versao_de(*tabelas),
+        date.today(),  # Rotas usam a data atual como padrão
+        complemento() if complemento else None
+    )
+    return hashlib.sha1(repr(partes).encode('utf-8')).hexdigest()
+
+
+def com_etag(*tabelas, complemento=None):
+    """Responde 304 sem executar a rota quando o If-None-Match do cliente ainda é válido"""
+    def decorador(funcao):
+        @wraps(funcao)
+        def envoltorio(*args, **kwargs):
+            etag = calcular_etag(*tabelas, complemento=complemento)
+
+            if etag in request.if_none_match:
+                resposta = Response(status=304)
+            else:
+                resposta = make_response(funcao(*args, **kwargs))
+                if resposta.status_code != 200:
+                    return resposta
+
+            resposta.set_etag(etag)
+            # Obriga o navegador a revalidar a cada uso, reaproveitando o corpo quando receber 304
+            resposta.headers['Cache-Control'] = 'private, no-cache'
+            return resposta
+        return envoltorio
+    return decorador
@@ -0,0 +1,127 @@
+import csv
+import io
+import json
+from datetime import date, datetime
+from sqlalchemy import select
+from sqlalchemy.orm import aliased
+from app import db
+from app.models.despesa import Despesa
+from app.models.aporte import Aporte
+from app.models.categoria import Categoria
+from app.models.cartao import Cartao
+from app.models.usuario import Usuario
+
+# Linhas buscadas por vez do cursor do banco e gravadas por bloco da resposta
+TAMANHO_LOTE = 1000
+
+FORMATOS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson'
+}
+
+
+def consulta_exportacao_despesas():
+    """SELECT com colunas planas (nomes já resolvidos por JOIN) na ordem do arquivo exportado"""
+    pagador = aliased(Usuario)
+    return (
+        select(
+            Despesa.id,
+            Despesa.descricao,
+            Despesa.origem,
+            Despesa.categoria_id,
+            Categoria.nome.label('categoria'),
+            Despesa.valor_total,
+            Despesa.valor_dividido,
+            Despesa.data_compra,
+            Despesa.data_vencimento,
+            Despesa.forma_pagamento,
+            Despesa.cartao_id,
+            Cartao.nome.label('cartao'),
+            Despesa.pago_por_id,
+            pagador.nome.label('pago_por'),
+            Despesa.status,
+            Despesa.tipo_despesa,
+            Despesa.frequencia,
+            Despesa.total_parcelas,
+            Despesa.parcela_atual,
+            Despesa.despesa_pai_id
+        )
+        .outerjoin(Categoria, Categoria.id == Despesa.categoria_id)
+        .outerjoin(Cartao, Cartao.id == Despesa.cartao_id)
+        .outerjoin(pagador, pagador.id == Despesa.pago_por_id)
+        .order_by(Despesa.data_compra, Despesa.id)
+    )
+
+
+def consulta_exportacao_aportes():
+    """SELECT com colunas planas dos aportes, com o nome do investidor"""
+    return (
+        select(
+            Aporte.id,
+            Aporte.usuario_id,
+            Usuario.nome.label('usuario'),
+            Aporte.valor,
+            Aporte.data,
+            Aporte.observacao
+        )
+        .outerjoin(Usuario, Usuario.id == Aporte.usuario_id)
+        .order_by(Aporte.data, Aporte.id)
+    )
+
+
+def _valor_texto(valor):
+    if isinstance(valor, (date, datetime)):
+        return valor.isoformat()
+    return valor
+
+
+def _linhas(consulta):
+    """Percorre o resultado com cursor no servidor, sem materializar a lista inteira"""
+    resultado = db.session.execute(consulta.execution_options(yield_per=TAMANHO_LOTE))
+    try:
+        for linhas in resultado.partitions():
+            yield resultado.keys(), linhas
+    finally:
+        resultado.close()
+
+
+def gerar_csv(consulta):
+    """Gera o CSV em blocos de até TAMANHO_LOTE linhas, começando pelo cabeçalho"""
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    cabecalho_escrito = False
+
+    for colunas, linhas in _linhas(consulta):
+        if not cabecalho_escrito:
+            escritor.writerow(list(colunas))
+            cabecalho_escrito = True
+        escritor.writerows(
+            [_valor_texto(valor) for valor in linha] for linha in linhas
+        )
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+    if not cabecalho_escrito:
+        # Sem linhas: ainda devolve o cabeçalho
+        escritor.writerow(list(consulta.selected_columns.keys()))
+        yield buffer.getvalue()
+
+
+def gerar_ndjson(consulta):
+    """Gera um objeto JSON plano por linha"""
+    for colunas, linhas in _linhas(consulta):
+        colunas = list(colunas)
+        yield ''.join(
+            json.dumps(
+                {coluna: _valor_texto(valor) for coluna, valor in zip(colunas, linha)},
+                ensure_ascii=False
+            ) + '\n'
+            for linha in linhas
+        )
+
+
+GERADORES = {
+    'csv': gerar_csv,
+    'ndjson': gerar_ndjson
+}
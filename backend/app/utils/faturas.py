@@ -0,0 +1,180 @@
+from datetime import date
+from sqlalchemy import and_, case, func, or_, select
+from app import db
+from app.models.cartao import Cartao
+from app.models.despesa import Despesa
+from app.models.fatura import Fatura
+from app.utils.alteracoes import observar_alteracoes
+from app.utils.calendario_faturas import calendario_cartao
+from app.utils.versoes import registrar_alteracao
+
+def ciclos_a_partir(cartao, ano, mes, quantidade):
+    """Os `quantidade` ciclos consecutivos do cartão, começando pela fatura que fecha em ano/mes"""
+    return calendario_cartao(cartao).ciclos(ano, mes, quantidade)
+
+
+def proximos_ciclos(cartao, hoje, quantidade):
+    """Ciclos a partir da fatura em aberto na data `hoje`"""
+    ciclo = calendario_cartao(cartao).ciclo_da_data(hoje)
+    return ciclos_a_partir(cartao, ciclo.ano, ciclo.mes, quantidade)
+
+
+def totais_por_ciclo(cartao_id, ciclos):
+    """(total, quantidade, pendentes) de cada ciclo numa única consulta, agrupando data_compra por janela de fechamento"""
+    if not ciclos:
+        return []
+
+    # Ciclos são consecutivos: basta comparar com os fechamentos em ordem
+    indice_ciclo = case(
+        *[(Despesa.data_compra <= ciclo.fechamento, indice) for indice, ciclo in enumerate(ciclos)]
+    ).label('ciclo')
+
+    linhas = db.session.query(
+        indice_ciclo,
+        func.coalesce(func.sum(Despesa.valor_total), 0.0),
+        func.count(Despesa.id),
+        func.coalesce(func.sum(case((Despesa.status != 'pago', 1), else_=0)), 0)
+    ).filter(
+        Despesa.cartao_id == cartao_id,
+        Despesa.data_compra > ciclos[0].inicio,
+        Despesa.data_compra <= ciclos[-1].fechamento
+    ).group_by(indice_ciclo).all()
+
+    totais = [(0.0, 0, 0)] * len(ciclos)
+    for indice, total, quantidade, pendentes in linhas:
+        totais[indice] = (float(total), quantidade, pendentes)
+    return totais
+
+
+def filtro_janelas(ciclos_cartoes):
+    """Despesas cuja data_compra cai na janela do próprio cartão, dado {cartao_id: Ciclo}"""
+    # Cartões com o mesmo dia de fechamento compartilham a janela: uma condição por janela distinta
+    por_janela = {}
+    for cartao_id, ciclo in ciclos_cartoes.items():
+        por_janela.setdefault((ciclo.inicio, ciclo.fechamento), []).append(cartao_id)
+
+    return or_(*[
+        and_(Despesa.cartao_id.in_(cartoes), Despesa.data_compra > inicio, Despesa.data_compra <= fechamento)
+        for (inicio, fechamento), cartoes in por_janela.items()
+    ])
+
+
+def totais_por_cartao(ciclos_cartoes):
+    """(total, quantidade, pendentes) de cada cartão na sua janela, numa única consulta agrupada"""
+    if not ciclos_cartoes:
+        return {}
+
+    linhas = db.session.query(
+        Despesa.cartao_id,
+        func.coalesce(func.sum(Despesa.valor_total), 0.0),
+        func.count(Despesa.id),
+        func.coalesce(func.sum(case((Despesa.status != 'pago', 1), else_=0)), 0)
+    ).filter(filtro_janelas(ciclos_cartoes)).group_by(Despesa.cartao_id).all()
+
+    totais = {cartao_id: (0.0, 0, 0) for cartao_id in ciclos_cartoes}
+    for cartao_id, total, quantidade, pendentes in linhas:
+        totais[cartao_id] = (float(total), quantidade, pendentes)
+    return totais
+
+
+def status_fatura(quantidade, pendentes):
+    return 'paga' if quantidade and not pendentes else 'fechada'
+
+
+def fechar_faturas(hoje=None):
+    """Grava a fotografia de cada ciclo já fechado que ainda não tem uma; retorna quantas foram criadas"""
+    hoje = hoje or date.today()
+
+    ultimas = dict(
+        db.session.query(Fatura.cartao_id, func.max(Fatura.ano * 12 + Fatura.mes - 1)).group_by(Fatura.cartao_id)
+    )
+    primeiras_compras = dict(
+        db.session.query(Despesa.cartao_id, func.min(Despesa.data_compra))
+        .filter(Despesa.cartao_id.isnot(None))
+        .group_by(Despesa.cartao_id)
+    )
+
+    criadas = 0
+    for cartao in Cartao.query.all():
+        # Ciclos fechados: todos antes do ciclo que contém a data de hoje
+        calendario = calendario_cartao(cartao)
+        aberto = calendario.ciclo_da_data(hoje)
+
+        if cartao.id in ultimas:
+            indice = ultimas[cartao.id] + 1
+            ano, mes = indice // 12, indice % 12 + 1
+        elif cartao.id in primeiras_compras:
+            primeiro = calendario.ciclo_da_data(primeiras_compras[cartao.id])
+            ano, mes = primeiro.ano, primeiro.mes
+        else:
+            continue
+
+        quantidade = (aberto.ano * 12 + aberto.mes) - (ano * 12 + mes)
+        ciclos = ciclos_a_partir(cartao, ano, mes, quantidade)
+        for ciclo, (valor_total, quantidade_despesas, pendentes) in zip(ciclos, totais_por_ciclo(cartao.id, ciclos)):
+            db.session.add(Fatura(
+                cartao_id=cartao.id,
+                ano=ciclo.ano,
+                mes=ciclo.mes,
+                data_inicio=ciclo.inicio,
+                data_fechamento=ciclo.fechamento,
+                data_vencimento=ciclo.vencimento,
+                valor_total=valor_total,
+                quantidade_despesas=quantidade_despesas,
+                status=status_fatura(quantidade_despesas, pendentes)
+            ))
+            criadas += 1
+
+    db.session.commit()
+    return criadas
+
+
+def _recalcular_faturas(conexao, ids):
+    """Refaz totais e status das fotografias informadas a partir das despesas do ciclo"""
+    faturas = Fatura.__table__
+    despesas = Despesa.__table__
+    no_ciclo = and_(
+        despesas.c.cartao_id == faturas.c.cartao_id,
+        despesas.c.data_compra > faturas.c.data_inicio,
+        despesas.c.data_compra <= faturas.c.data_fechamento
+    )
+
+    total = select(func.coalesce(func.sum(despesas.c.valor_total), 0.0)).where(no_ciclo).scalar_subquery()
+    quantidade = select(func.count(despesas.c.id)).where(no_ciclo).scalar_subquery()
+    pendentes = select(func.count(despesas.c.id)).where(no_ciclo, despesas.c.status != 'pago').scalar_subquery()
+
+    conexao.execute(
+        faturas.update().where(faturas.c.id.in_(ids)).values(
+            valor_total=total,
+            quantidade_despesas=quantidade,
+            status=case((and_(quantidade > 0, pendentes == 0), 'paga'), else_='fechada')
+        )
+    )
+
+
+@observar_alteracoes
+def _atualizar_faturas(conexao, alteracoes):
+    """Mantém as fotografias corretas quando uma despesa de ciclo já fechado é incluída, alterada ou excluída"""
+    compras = set()
+    for alteracao in alteracoes:
+        if alteracao.modelo is not Despesa:
+            continue
+        for valores in (alteracao.anterior, alteracao.atual):
+            if valores and valores['cartao_id'] and valores['data_compra']:
+                compras.add((valores['cartao_id'], valores['data_compra']))
+
+    if not compras:
+        return
+
+    faturas = Fatura.__table__
+    condicoes = [
+        and_(faturas.c.cartao_id == cartao_id, faturas.c.data_inicio < data_compra, faturas.c.data_fechamento >= data_compra)
+        for cartao_id, data_compra in compras
+    ]
+    ids = set()
+    for inicio in range(0, len(condicoes), 200):
+        ids.update(conexao.execute(select(faturas.c.id).where(or_(*condicoes[inicio:inicio + 200]))).scalars())
+
+    if ids:
+        _recalcular_faturas(conexao, sorted(ids))
+        registrar_alteracao(conexao, 'faturas')
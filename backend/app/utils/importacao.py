@@ -0,0 +1,226 @@
+import codecs
+import csv
+import itertools
+import re
+from datetime import datetime
+from app import db
+from app.models.despesa import Despesa
+from app.models.categoria import Categoria
+from app.models.cartao import Cartao
+from app.models.usuario import Usuario
+from app.utils.alteracoes import inserir_em_massa
+from app.utils.versoes import registrar_alteracao
+
+TAMANHO_LOTE = 500
+
+STATUS_VALIDOS = ['pendente', 'pago']
+
+
+class ErroLinha(ValueError):
+    pass
+
+
+def _linhas_texto(stream, encoding, errors='strict'):
+    """Decodifica o upload linha a linha; io.TextIOWrapper não aceita o SpooledTemporaryFile antes do Python 3.11"""
+    decodificador = codecs.getincrementaldecoder(encoding)(errors=errors)
+    for linha in stream:
+        yield decodificador.decode(linha)
+    final = decodificador.decode(b'', final=True)
+    if final:
+        yield final
+
+
+def ler_csv(stream):
+    """Percorre o CSV sem carregá-lo inteiro, gerando (número da linha, registro)"""
+    texto = _linhas_texto(stream, 'utf-8-sig', errors='replace')
+    cabecalho = next(texto, '')
+    if not cabecalho:
+        return
+
+    # Planilhas em português costumam exportar com ';'
+    delimitador = ';' if cabecalho.count(';') > cabecalho.count(',') else ','
+    leitor = csv.DictReader(itertools.chain([cabecalho], texto), delimiter=delimitador)
+
+    for registro in leitor:
+        registro = {
+            (chave or '').strip().lower(): (valor or '').strip()
+            for chave, valor in registro.items()
+            if chave is not None
+        }
+        yield leitor.line_num, registro
+
+
+_TAG_OFX = re.compile(r'<(/?[A-Za-z0-9.]+)>([^<\r\n]*)')
+
+
+def ler_ofx(stream):
+    """Percorre as transações (STMTTRN) de um OFX 1.x (SGML) ou 2.x (XML) linha a linha"""
+    texto = _linhas_texto(stream, 'latin-1')
+    transacao = None
+    numero = 0
+
+    for linha in texto:
+        for tag, valor in _TAG_OFX.findall(linha):
+            tag = tag.upper()
+            if tag == 'STMTTRN':
+                transacao = {}
+                numero += 1
+            elif tag == '/STMTTRN' and transacao is not None:
+                valor_transacao = transacao.get('TRNAMT', '')
+                yield numero, {
+                    'descricao': transacao.get('MEMO') or transacao.get('NAME', ''),
+                    'origem': transacao.get('NAME', ''),
+                    'valor_total': valor_transacao,
+                    'data_compra': transacao.get('DTPOSTED', '')[:8],
+                    'credito': not valor_transacao.startswith('-')
+                }
+                transacao = None
+            elif transacao is not None and not tag.startswith('/'):
+                transacao[tag] = valor.strip()
+
+
+class Referencias:
+    """Categorias, cartões e usuários carregados uma vez para validar todas as linhas em memória"""
+
+    def __init__(self):
+        self.categorias = {}
+        for id, nome in db.session.query(Categoria.id, Categoria.nome):
+            self.categorias[str(id)] = id
+            self.categorias[nome.strip().lower()] = id
+
+        self.cartoes = {}
+        for id, nome in db.session.query(Cartao.id, Cartao.nome):
+            self.cartoes[str(id)] = id
+            self.cartoes[nome.strip().lower()] = id
+
+        self.usuarios = {}
+        for id, email in db.session.query(Usuario.id, Usuario.email):
+            self.usuarios[str(id)] = id
+            self.usuarios[email.strip().lower()] = id
+
+    @staticmethod
+    def _buscar(mapa, valor, mensagem):
+        if valor in (None, ''):
+            return None
+        encontrado = mapa.get(str(valor).strip().lower())
+        if encontrado is None:
+            raise ErroLinha(f'{mensagem}: {valor}')
+        return encontrado
+
+    def categoria(self, valor):
+        return self._buscar(self.categorias, valor, 'Categoria não encontrada')
+
+    def cartao(self, valor):
+        return self._buscar(self.cartoes, valor, 'Cartão não encontrado')
+
+    def usuario(self, valor):
+        return self._buscar(self.usuarios, valor, 'Usuário não encontrado')
+
+
+def _converter_valor(texto):
+    texto = str(texto).strip().replace('R$', '').replace(' ', '')
+    if ',' in texto:
+        # Formato brasileiro: 1.234,56
+        texto = texto.replace('.', '').replace(',', '.')
+    try:
+        return float(texto)
+    except ValueError:
+        raise ErroLinha(f'Valor inválido: {texto}')
+
+
+def _converter_data(texto):
+    texto = str(texto).strip()
+    for formato in ('%Y-%m-%d', '%d/%m/%Y', '%Y%m%d'):
+        try:
+            return datetime.strptime(texto[:10], formato).date()
+        except ValueError:
+            continue
+    raise ErroLinha(f'Data inválida: {texto}')
+
+
+def converter_registro(registro, referencias, padroes):
+    """Valida um registro lido do arquivo e o converte nos valores da tabela despesas"""
+    if registro.get('credito'):
+        raise ErroLinha('Lançamento de crédito ignorado')
+
+    descricao = registro.get('descricao')
+    if not descricao:
+        raise ErroLinha("Campo 'descricao' é obrigatório")
+
+    if not registro.get('valor_total'):
+        raise ErroLinha("Campo 'valor_total' é obrigatório")
+    valor_total = abs(_converter_valor(registro['valor_total']))
+    if valor_total == 0:
+        raise ErroLinha('Valor total deve ser positivo')
+
+    if not registro.get('data_compra'):
+        raise ErroLinha("Campo 'data_compra' é obrigatório")
+    data_compra = _converter_data(registro['data_compra'])
+    data_vencimento = _converter_data(registro['data_vencimento']) if registro.get('data_vencimento') else data_compra
+
+    categoria_id = referencias.categoria(registro.get('categoria') or registro.get('categoria_id') or padroes['categoria_id'])
+    if categoria_id is None:
+        raise ErroLinha("Campo 'categoria' é obrigatório")
+
+    cartao_id = referencias.cartao(registro.get('cartao') or registro.get('cartao_id') or padroes['cartao_id'])
+    # Só admin lança despesas em nome de outro investidor; os demais sempre pagam as próprias
+    pago_por_id = padroes['pago_por_id']
+    if padroes['pago_por_livre']:
+        pago_por_id = referencias.usuario(registro.get('pago_por') or registro.get('pago_por_id')) or pago_por_id
+
+    status = (registro.get('status') or padroes['status']).lower()
+    if status not in STATUS_VALIDOS:
+        raise ErroLinha(f'Status inválido: {status}')
+
+    valor_dividido = registro.get('valor_dividido')
+
+    return {
+        'descricao': descricao[:255],
+        'origem': (registro.get('origem') or '')[:100] or None,
+        'categoria_id': categoria_id,
+        'valor_total': valor_total,
+        'valor_dividido': _converter_valor(valor_dividido) if valor_dividido else None,
+        'data_compra': data_compra,
+        'data_vencimento': data_vencimento,
+        'forma_pagamento': registro.get('forma_pagamento') or ('Cartão' if cartao_id else None),
+        'cartao_id': cartao_id,
+        'pago_por_id': pago_por_id,
+        'status': status,
+        'tipo_despesa': 'única'
+    }
+
+
+def importar_despesas(registros, padroes):
+    """Importa os registros numa única transação, em lotes, retornando o relatório por linha"""
+    referencias = Referencias()
+    importadas = 0
+    erros = []
+    lote = []
+
+    try:
+        for numero, registro in registros:
+            try:
+                lote.append(converter_registro(registro, referencias, padroes))
+            except ErroLinha as e:
+                erros.append({'linha': numero, 'erro': str(e)})
+                continue
+
+            if len(lote) >= TAMANHO_LOTE:
+                importadas += len(inserir_em_massa(db.session.connection(), Despesa, lote))
+                lote = []
+
+        if lote:
+            importadas += len(inserir_em_massa(db.session.connection(), Despesa, lote))
+
+        if importadas:
+            registrar_alteracao(db.session.connection(), 'despesas')
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return {
+        'importadas': importadas,
+        'com_erro': len(erros),
+        'erros': erros
+    }
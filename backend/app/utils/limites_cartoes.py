@@ -0,0 +1,107 @@
+from collections import defaultdict
+from flask import current_app
+from app import db
+from app.models.cartao import Cartao
+from app.models.despesa import Despesa
+from app.models.saldo_cartao import SaldoCartao
+from app.utils.alteracoes import observar_alteracoes
+
+POLITICAS_LIMITE = ['ignorar', 'avisar', 'bloquear']
+
+
+def _contribuicao(valores):
+    """Despesa em cartão ainda não paga: (cartao_id, valor) que compõe o saldo em aberto"""
+    if valores is None or not valores['cartao_id'] or valores['status'] == 'pago':
+        return None
+    return valores['cartao_id'], valores['valor_total'] or 0
+
+
+def aplicar_deltas_saldos(conexao, deltas):
+    """Soma os deltas {cartao_id: [valor, quantidade]} às linhas de saldos_cartoes"""
+    tabela = SaldoCartao.__table__
+
+    for cartao_id, (valor, quantidade) in deltas.items():
+        if not valor and not quantidade:
+            continue
+
+        resultado = conexao.execute(
+            tabela.update().where(tabela.c.cartao_id == cartao_id).values(
+                saldo_aberto=tabela.c.saldo_aberto + valor,
+                quantidade=tabela.c.quantidade + quantidade
+            )
+        )
+        if resultado.rowcount == 0:
+            conexao.execute(tabela.insert().values(cartao_id=cartao_id, saldo_aberto=valor, quantidade=quantidade))
+
+
+@observar_alteracoes
+def _atualizar_saldos_cartoes(conexao, alteracoes):
+    """Aplica em saldos_cartoes a diferença entre o estado anterior e o novo de cada despesa"""
+    deltas = defaultdict(lambda: [0.0, 0])
+
+    for alteracao in alteracoes:
+        if alteracao.modelo is not Despesa:
+            continue
+        for valores, sinal in ((alteracao.anterior, -1), (alteracao.atual, 1)):
+            contribuicao = _contribuicao(valores)
+            if contribuicao is not None:
+                cartao_id, valor = contribuicao
+                deltas[cartao_id][0] += sinal * valor
+                deltas[cartao_id][1] += sinal
+
+    if deltas:
+        aplicar_deltas_saldos(conexao, deltas)
+
+
+def reconstruir_saldos_cartoes():
+    """Recalcula saldos_cartoes a partir das despesas em aberto"""
+    db.session.query(SaldoCartao).delete()
+
+    linhas = db.session.query(
+        Despesa.cartao_id,
+        db.func.sum(Despesa.valor_total),
+        db.func.count(Despesa.id)
+    ).filter(
+        Despesa.cartao_id.isnot(None),
+        db.or_(Despesa.status.is_(None), Despesa.status != 'pago')
+    ).group_by(Despesa.cartao_id).all()
+
+    db.session.add_all([
+        SaldoCartao(cartao_id=cartao_id, saldo_aberto=total or 0, quantidade=quantidade)
+        for cartao_id, total, quantidade in linhas
+    ])
+    db.session.commit()
+    return len(linhas)
+
+
+def excesso_limite(cartao_id, acrescimo):
+    """Quanto o cartão passaria do limite com mais `acrescimo` em aberto; None se couber ou não houver limite"""
+    # Sem autoflush: alterações pendentes da despesa em edição ainda não devem entrar no saldo
+    with db.session.no_autoflush:
+        linha = db.session.query(Cartao.limite, SaldoCartao.saldo_aberto).outerjoin(
+            SaldoCartao, SaldoCartao.cartao_id == Cartao.id
+        ).filter(Cartao.id == cartao_id).first()
+    if linha is None:
+        return None
+
+    limite, saldo_aberto = linha
+    if not limite:
+        return None  # Limite zero ou não informado: cartão sem controle de limite
+    excesso = (saldo_aberto or 0) + acrescimo - limite
+    return excesso if excesso > 0 else None
+
+
+def verificar_limite(cartao_id, acrescimo):
+    """Aplica a política LIMITE_CARTAO_POLITICA: retorna (erro, aviso), no máximo um deles preenchido"""
+    politica = current_app.config.get('LIMITE_CARTAO_POLITICA', 'avisar')
+    if politica == 'ignorar' or not cartao_id or acrescimo <= 0:
+        return None, None
+
+    excesso = excesso_limite(cartao_id, acrescimo)
+    if excesso is None:
+        return None, None
+
+    mensagem = f'Despesa excede o limite disponível do cartão em {excesso:.2f}'
+    if politica == 'bloquear':
+        return mensagem, None
+    return None, mensagem
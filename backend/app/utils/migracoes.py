@@ -0,0 +1,28 @@
+from app import db
+from app.utils.busca import TABELA_BUSCA, configurar_busca, reconstruir_busca
+
+
+def aplicar_migracoes():
+    """Cria tabelas e índices que ainda não existem no banco (idempotente)
+
+    db.create_all() só cria tabelas novas; índices declarados depois em tabelas já existentes
+    precisam ser criados um a um.
+    """
+    db.create_all()
+
+    inspetor = db.inspect(db.engine)
+    criados = []
+    for tabela in db.metadata.sorted_tables:
+        for indice in tabela.indexes:
+            if not inspetor.has_index(tabela.name, indice.name):
+                indice.create(bind=db.engine)
+                criados.append(indice.name)
+
+    # Índice textual (FTS5/tsvector) não é declarado como modelo
+    with db.engine.begin() as conexao:
+        indice_novo = configurar_busca(conexao)
+    if indice_novo:
+        reconstruir_busca()
+        criados.append(TABELA_BUSCA)
+
+    return criados
@@ -0,0 +1,50 @@
+import base64
+import json
+from datetime import date, datetime
+from app import db
+
+
+class CursorInvalido(ValueError):
+    pass
+
+
+def codificar_cursor(*valores):
+    """Gera um token opaco com os valores de ordenação do último item da página"""
+    serializados = [valor.isoformat() if isinstance(valor, (date, datetime)) else valor for valor in valores]
+    return base64.urlsafe_b64encode(json.dumps(serializados).encode('utf-8')).decode('ascii')
+
+
+def decodificar_cursor(token):
+    """Lê um token gerado por codificar_cursor"""
+    try:
+        return json.loads(base64.urlsafe_b64decode(token.encode('ascii')).decode('utf-8'))
+    except (ValueError, TypeError) as e:
+        raise CursorInvalido(f'Cursor inválido: {e}')
+
+
+def paginar_por_cursor(query, coluna_data, coluna_id, cursor, por_pagina):
+    """Página decrescente por (coluna_data, coluna_id) a partir do cursor, sem OFFSET nem COUNT
+
+    Retorna (itens, proximo_cursor); proximo_cursor é None na última página.
+    """
+    if cursor:
+        valores = decodificar_cursor(cursor)
+        try:
+            data_cursor = datetime.fromisoformat(valores[0]).date()
+            id_cursor = int(valores[1])
+        except (ValueError, TypeError, IndexError, AttributeError) as e:
+            raise CursorInvalido(f'Cursor inválido: {e}')
+        query = query.filter(db.tuple_(coluna_data, coluna_id) < (data_cursor, id_cursor))
+
+    # Um item a mais indica se existe próxima página
+    itens = query.order_by(coluna_data.desc(), coluna_id.desc()).limit(por_pagina + 1).all()
+
+    proximo_cursor = None
+    if len(itens) > por_pagina:
+        itens = itens[:por_pagina]
+        ultimo = itens[-1]
+        proximo_cursor = codificar_cursor(
+            getattr(ultimo, coluna_data.key), getattr(ultimo, coluna_id.key)
+        )
+
+    return itens, proximo_cursor
@@ -0,0 +1,241 @@
+import math
+from datetime import datetime
+from sqlalchemy import literal, select
+from sqlalchemy.orm import aliased
+from app import db
+from app.models.despesa import Despesa
+from app.models.cartao import Cartao
+from app.utils.alteracoes import inserir_em_massa
+from app.utils.carregamento import opcoes_serializacao_despesa
+from app.utils.calendario_faturas import calendario_cartao, data_no_mes, somar_meses
+from app.utils.versoes import registrar_alteracao
+
+INTERVALO_MESES = {'mensal': 1, 'trimestral': 3, 'anual': 12}
+
+# Quantidade padrão de recorrências materializadas quando não informada
+QUANTIDADE_RECORRENCIAS = 12
+
+
+class ErroExpansao(ValueError):
+    pass
+
+
+def _data(valor):
+    return valor.date() if isinstance(valor, datetime) else valor
+
+
+def _deslocar(data, meses):
+    ano, mes = somar_meses(data.year, data.month, meses)
+    return data_no_mes(ano, mes, data.day)
+
+
+def datas_ocorrencia(despesa, cartao, deslocamento):
+    """(data_compra, data_vencimento) da ocorrência `deslocamento` meses depois da despesa original
+
+    Em cartão, a compra avança de fatura em fatura e o vencimento é o da fatura correspondente;
+    sem cartão, o vencimento original é deslocado.
+    """
+    data_compra = _deslocar(_data(despesa.data_compra), deslocamento)
+    if cartao is None:
+        return data_compra, _deslocar(_data(despesa.data_vencimento), deslocamento)
+
+    calendario = calendario_cartao(cartao)
+    ciclo = calendario.ciclo_da_data(_data(despesa.data_compra))
+    return data_compra, calendario.ciclo(*somar_meses(ciclo.ano, ciclo.mes, deslocamento)).vencimento
+
+
+def _dividir_parcelas(valor, parcelas):
+    """(primeira, demais): valor repartido em centavos, com a sobra do arredondamento na primeira parcela"""
+    if valor is None:
+        return None, None
+    demais = math.floor(round(valor * 100 / parcelas, 6)) / 100
+    return round(valor - demais * (parcelas - 1), 10), demais
+
+
+def _intervalo(despesa):
+    if despesa.tipo_despesa == 'parcelada':
+        return 1
+    intervalo = INTERVALO_MESES.get(despesa.frequencia)
+    if intervalo is None:
+        raise ErroExpansao('Frequência inválida (use mensal, trimestral ou anual)')
+    return intervalo
+
+
+def expandir_despesa(despesa, quantidade=None):
+    """Cria de uma vez as parcelas 2..N (parcelada) ou as próximas recorrências da despesa pai
+
+    Na parcelada, valor_total/valor_dividido da despesa pai é o valor da compra inteira e passa a ser
+    repartido entre as parcelas (a pai fica com a primeira e a sobra do arredondamento); na recorrente,
+    cada ocorrência repete os valores da pai. Retorna os ids criados.
+    """
+    if despesa.tipo_despesa not in ['parcelada', 'recorrente']:
+        raise ErroExpansao('Apenas despesas parceladas ou recorrentes podem ser expandidas')
+    if despesa.despesa_pai_id:
+        raise ErroExpansao('A despesa já pertence a uma série')
+    if db.session.query(Despesa.id).filter(Despesa.despesa_pai_id == despesa.id).first():
+        raise ErroExpansao('A despesa já possui ocorrências geradas')
+
+    if despesa.tipo_despesa == 'parcelada':
+        total = quantidade or despesa.total_parcelas
+        if not total or total < 2:
+            raise ErroExpansao('Informe total_parcelas maior que 1')
+        despesa.total_parcelas = total
+        despesa.parcela_atual = 1
+        despesa.valor_total, valor_parcela = _dividir_parcelas(despesa.valor_total, total)
+        despesa.valor_dividido, dividido_parcela = _dividir_parcelas(despesa.valor_dividido, total)
+    else:
+        valor_parcela, dividido_parcela = despesa.valor_total, despesa.valor_dividido
+        total = (quantidade or QUANTIDADE_RECORRENCIAS) + 1
+    intervalo = _intervalo(despesa)
+
+    cartao = db.session.get(Cartao, despesa.cartao_id) if despesa.cartao_id else None
+    if cartao is not None:
+        # A despesa pai passa a vencer junto com a fatura em que caiu
+        despesa.data_vencimento = datas_ocorrencia(despesa, cartao, 0)[1]
+
+    linhas = []
+    for numero in range(2, total + 1):
+        data_compra, data_vencimento = datas_ocorrencia(despesa, cartao, (numero - 1) * intervalo)
+        linhas.append({
+            'origem': despesa.origem,
+            'descricao': despesa.descricao,
+            'categoria_id': despesa.categoria_id,
+            'valor_total': valor_parcela,
+            'valor_dividido': dividido_parcela,
+            'data_compra': data_compra,
+            'data_vencimento': data_vencimento,
+            'forma_pagamento': despesa.forma_pagamento,
+            'cartao_id': despesa.cartao_id,
+            'pago_por_id': despesa.pago_por_id,
+            'status': 'pendente',
+            'tipo_despesa': despesa.tipo_despesa,
+            'frequencia': despesa.frequencia,
+            'total_parcelas': despesa.total_parcelas,
+            'parcela_atual': numero if despesa.tipo_despesa == 'parcelada' else None,
+            'despesa_pai_id': despesa.id,
+            'data_criacao': datetime.utcnow()
+        })
+
+    # Grava alterações pendentes da despesa pai antes do INSERT em massa
+    db.session.flush()
+    conexao = db.session.connection()
+    ids = inserir_em_massa(conexao, Despesa, linhas)
+    registrar_alteracao(conexao, 'despesas')
+    return ids
+
+
+def ocorrencias_virtuais(inicio, fim, dono_id=None):
+    """Ocorrências de despesas recorrentes em [inicio, fim] calculadas pela regra, sem gravar linhas
+
+    Vencimentos já materializados (a própria despesa pai ou suas filhas) não são repetidos.
+    Com `dono_id`, só entram as séries pagas por esse usuário.
+    """
+    filtros = [
+        Despesa.tipo_despesa == 'recorrente',
+        Despesa.despesa_pai_id == None,  # noqa: E711
+        Despesa.frequencia.in_(list(INTERVALO_MESES))
+    ]
+    if dono_id is not None:
+        filtros.append(Despesa.pago_por_id == dono_id)
+    pais = Despesa.query.filter(*filtros).all()
+    if not pais:
+        return []
+
+    materializadas = set(db.session.execute(
+        select(Despesa.despesa_pai_id, Despesa.data_vencimento).where(
+            Despesa.despesa_pai_id.in_([pai.id for pai in pais]),
+            Despesa.data_vencimento >= inicio,
+            Despesa.data_vencimento <= fim
+        )
+    ).all())
+
+    cartoes = {
+        cartao.id: cartao
+        for cartao in Cartao.query.filter(Cartao.id.in_({pai.cartao_id for pai in pais if pai.cartao_id}))
+    }
+
+    ocorrencias = []
+    for pai in pais:
+        cartao = cartoes.get(pai.cartao_id)
+        intervalo = INTERVALO_MESES[pai.frequencia]
+        primeiro_vencimento = _data(pai.data_vencimento)
+
+        # Primeira ocorrência que pode cair no intervalo, sem percorrer os meses anteriores
+        meses_ate_inicio = (inicio.year - primeiro_vencimento.year) * 12 + inicio.month - primeiro_vencimento.month
+        ocorrencia = max(0, meses_ate_inicio // intervalo - 1)
+
+        while True:
+            try:
+                data_compra, data_vencimento = datas_ocorrencia(pai, cartao, ocorrencia * intervalo)
+            except (ValueError, OverflowError):
+                break  # Além do último ano representável (9999)
+            if data_vencimento > fim:
+                break
+            if data_vencimento >= inicio and ocorrencia > 0 and (pai.id, data_vencimento) not in materializadas:
+                ocorrencias.append({
+                    'despesa_pai_id': pai.id,
+                    'descricao': pai.descricao,
+                    'origem': pai.origem,
+                    'categoria_id': pai.categoria_id,
+                    'cartao_id': pai.cartao_id,
+                    'valor_total': pai.valor_total,
+                    'valor_dividido': pai.valor_dividido,
+                    'data_compra': data_compra.isoformat(),
+                    'data_vencimento': data_vencimento.isoformat(),
+                    'frequencia': pai.frequencia,
+                    'virtual': True
+                })
+            ocorrencia += 1
+
+    ocorrencias.sort(key=lambda item: item['data_vencimento'])
+    return ocorrencias
+
+
+def familia_despesa(id):
+    """Despesa raiz e todas as descendentes da série que contém `id`, em uma única consulta
+
+    Um CTE recursivo sobe por despesa_pai_id até a raiz e outro desce a partir dela;
+    retorna a lista ordenada com a raiz primeiro, ou vazia se a despesa não existir.
+    """
+    pai = aliased(Despesa)
+    ancestrais = select(Despesa.id, Despesa.despesa_pai_id).where(
+        Despesa.id == id
+    ).cte('ancestrais', recursive=True)
+    ancestrais = ancestrais.union_all(
+        select(pai.id, pai.despesa_pai_id).join(ancestrais, pai.id == ancestrais.c.despesa_pai_id)
+    )
+    raiz = select(ancestrais.c.id).where(ancestrais.c.despesa_pai_id == None)  # noqa: E711
+
+    filha = aliased(Despesa)
+    familia = select(Despesa.id, literal(0).label('nivel')).where(
+        Despesa.id.in_(raiz)
+    ).cte('familia', recursive=True)
+    familia = familia.union_all(
+        select(filha.id, familia.c.nivel + 1).join(familia, filha.despesa_pai_id == familia.c.id)
+    )
+
+    return Despesa.query.options(*opcoes_serializacao_despesa()).join(
+        familia, Despesa.id == familia.c.id
+    ).order_by(
+        familia.c.nivel, Despesa.data_vencimento, Despesa.parcela_atual, Despesa.id
+    ).all()
+
+
+def resumo_familia(despesas, id):
+    """Totais de pagas/pendentes e saldo restante da série retornada por familia_despesa"""
+    pagas = [despesa for despesa in despesas if despesa.status == 'pago']
+    pendentes = [despesa for despesa in despesas if despesa.status != 'pago']
+    atual = next((despesa for despesa in despesas if despesa.id == id), None)
+
+    return {
+        'raiz': despesas[0].to_dict(),
+        'ocorrencias': [despesa.to_dict() for despesa in despesas[1:]],
+        'despesa_id': id,
+        'posicao': atual.parcela_atual if atual else None,
+        'quantidade': len(despesas),
+        'pagas': len(pagas),
+        'pendentes': len(pendentes),
+        'valor_total': sum(despesa.valor_total for despesa in despesas),
+        'valor_pago': sum(despesa.valor_total for despesa in pagas),
+        'valor_restante': sum(despesa.valor_total for despesa in pendentes)
+    }
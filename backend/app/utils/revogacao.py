@@ -0,0 +1,74 @@
+import threading
+import time
+from datetime import datetime
+from app import db
+from app.models.token_revogado import TokenRevogado
+
+# Intervalo entre buscas de novas revogações feitas por outros processos
+INTERVALO_ATUALIZACAO = 5
+# Intervalo entre recargas completas, que descartam da memória os tokens já removidos do banco
+INTERVALO_RECARGA = 3600
+
+
+class ListaRevogacao:
+    """jtis revogados em memória; o banco só é lido para buscar linhas novas (id > último visto)"""
+
+    def __init__(self):
+        self._jtis = set()
+        self._ultimo_id = 0
+        self._atualizar_em = 0
+        self._recarregar_em = 0
+        self._lock = threading.Lock()
+
+    def contem(self, jti):
+        agora = time.monotonic()
+        if agora >= self._atualizar_em:
+            self._atualizar(agora)
+        return jti in self._jtis
+
+    def _atualizar(self, agora):
+        completa = agora >= self._recarregar_em
+        ultimo_id = 0 if completa else self._ultimo_id
+
+        linhas = db.session.query(TokenRevogado.id, TokenRevogado.jti).filter(
+            TokenRevogado.id > ultimo_id
+        ).all()
+
+        with self._lock:
+            if completa:
+                # Também recupera ids gravados fora de ordem por transações concorrentes
+                self._jtis = set()
+                self._ultimo_id = 0
+                self._recarregar_em = agora + INTERVALO_RECARGA
+            for id, jti in linhas:
+                self._jtis.add(jti)
+                self._ultimo_id = max(self._ultimo_id, id)
+            self._atualizar_em = agora + INTERVALO_ATUALIZACAO
+
+    def adicionar(self, jti):
+        """Vale imediatamente neste processo; os demais veem a revogação na próxima atualização"""
+        with self._lock:
+            self._jtis.add(jti)
+
+
+lista_revogacao = ListaRevogacao()
+
+
+def revogar_token(dados_token):
+    """Grava o jti do token (claims decodificadas) na lista de revogação"""
+    jti = dados_token['jti']
+    if not TokenRevogado.query.filter_by(jti=jti).first():
+        db.session.add(TokenRevogado(
+            jti=jti,
+            usuario_id=int(dados_token['sub']),
+            expira_em=datetime.utcfromtimestamp(dados_token['exp'])
+        ))
+        db.session.commit()
+    lista_revogacao.adicionar(jti)
+
+
+def limpar_tokens_expirados():
+    """Remove revogações de tokens que já expiraram; retorna quantas linhas foram apagadas"""
+    removidos = TokenRevogado.query.filter(TokenRevogado.expira_em < datetime.utcnow()).delete()
+    db.session.commit()
+    return removidos
@@ -0,0 +1,208 @@
+import itertools
+from datetime import datetime
+from sqlalchemy import case, select
+from app import db
+from app.models.despesa import Despesa
+from app.models.aporte import Aporte
+from app.models.usuario import Usuario
+from app.models.lancamento_saldo import LancamentoSaldo
+from app.utils.alteracoes import observar_alteracoes
+
+# Datas por chamada de registrar_lancamentos: limita os parâmetros do CASE e das subconsultas
+DATAS_POR_LOTE = 200
+
+# Cada investidor tem um fluxo próprio de aportes (usuario_id) e todos compartilham o fluxo
+# de despesas divididas pagas (usuario_id nulo). O saldo é a soma dos dois saldos acumulados.
+
+
+def _data(valor):
+    return valor.date() if isinstance(valor, datetime) else valor
+
+
+def _lancamento(modelo, valores):
+    """Converte os valores de um aporte/despesa em (usuario_id, data, valor) ou None"""
+    if valores is None:
+        return None
+
+    if modelo is Aporte:
+        if not valores['data'] or not valores['valor']:
+            return None
+        return valores['usuario_id'], _data(valores['data']), valores['valor']
+
+    if valores['status'] != 'pago' or not valores['valor_dividido'] or not valores['data_vencimento']:
+        return None
+    return None, _data(valores['data_vencimento']), -valores['valor_dividido']
+
+
+def registrar_lancamentos(conexao, usuario_id, lancamentos):
+    """Acrescenta ao fluxo um lançamento por data, dado {data: (valor, origem, referencia_id)}
+
+    Uma consulta lê os saldos anteriores de todas as datas, um único UPDATE desloca os lançamentos
+    posteriores e um INSERT grava os novos, qualquer que seja a quantidade de datas.
+    """
+    tabela = LancamentoSaldo.__table__
+    datas = sorted(lancamentos)
+
+    saldos_anteriores = conexao.execute(select(*[
+        select(tabela.c.saldo_acumulado).where(
+            tabela.c.usuario_id == usuario_id,
+            tabela.c.data <= data
+        ).order_by(tabela.c.data.desc(), tabela.c.id.desc()).limit(1).scalar_subquery()
+        for data in datas
+    ])).one()
+
+    # Soma dos novos valores até cada data, em ordem
+    acumulados = list(itertools.accumulate(lancamentos[data][0] for data in datas))
+
+    # Lançamentos retroativos deslocam o saldo acumulado das datas seguintes
+    deslocamento = case(*[
+        (tabela.c.data > data, acumulado)
+        for data, acumulado in reversed(list(zip(datas, acumulados)))
+    ], else_=0)
+    conexao.execute(
+        tabela.update().where(
+            tabela.c.usuario_id == usuario_id,
+            tabela.c.data > datas[0]
+        ).values(saldo_acumulado=tabela.c.saldo_acumulado + deslocamento)
+    )
+
+    agora = datetime.utcnow()
+    conexao.execute(tabela.insert(), [
+        {
+            'usuario_id': usuario_id,
+            'data': data,
+            'valor': lancamentos[data][0],
+            'saldo_acumulado': (saldo_anterior or 0) + acumulado,
+            'origem': lancamentos[data][1],
+            'referencia_id': lancamentos[data][2],
+            'data_criacao': agora
+        }
+        for data, saldo_anterior, acumulado in zip(datas, saldos_anteriores, acumulados)
+    ])
+
+
+@observar_alteracoes
+def _atualizar_lancamentos(conexao, alteracoes):
+    """Estorna o lançamento anterior e registra o novo sempre que aporte ou despesa paga mudam
+
+    As alterações do lote são somadas por (fluxo, data): cada data recebe um lançamento e cada
+    fluxo um único deslocamento, em vez de um por registro alterado.
+    """
+    por_fluxo = {}
+    for alteracao in alteracoes:
+        anterior = _lancamento(alteracao.modelo, alteracao.anterior)
+        atual = _lancamento(alteracao.modelo, alteracao.atual)
+        if anterior == atual:
+            continue
+
+        origem = 'aporte' if alteracao.modelo is Aporte else 'despesa'
+        movimentos = []
+        if anterior is not None:
+            usuario_id, data, valor = anterior
+            movimentos.append((usuario_id, data, -valor))
+        if atual is not None:
+            movimentos.append(atual)
+
+        for usuario_id, data, valor in movimentos:
+            valor_data, _, referencias = por_fluxo.setdefault(usuario_id, {}).get(data, (0, origem, set()))
+            referencias.add(alteracao.id)
+            por_fluxo[usuario_id][data] = (valor_data + valor, origem, referencias)
+
+    for usuario_id, por_data in por_fluxo.items():
+        # Lançamento agregado só aponta para o registro de origem quando há um único
+        lancamentos = {
+            data: (valor, origem, next(iter(referencias)) if len(referencias) == 1 else None)
+            for data, (valor, origem, referencias) in por_data.items()
+            if valor != 0
+        }
+        datas = sorted(lancamentos)
+        for inicio in range(0, len(datas), DATAS_POR_LOTE):
+            registrar_lancamentos(
+                conexao, usuario_id, {data: lancamentos[data] for data in datas[inicio:inicio + DATAS_POR_LOTE]}
+            )
+
+
+def _saldo_fluxo(usuario_id, data=None):
+    """Subconsulta do saldo acumulado mais recente do fluxo até a data (indexada por usuario_id, data)"""
+    consulta = select(LancamentoSaldo.saldo_acumulado).where(LancamentoSaldo.usuario_id == usuario_id)
+    if data is not None:
+        consulta = consulta.where(LancamentoSaldo.data <= data)
+    return consulta.order_by(LancamentoSaldo.data.desc(), LancamentoSaldo.id.desc()).limit(1)
+
+
+def saldos_investidores(data=None):
+    """Aportes, despesas pagas, despesas divididas e saldo de todos os investidores ativos na data (ou atuais)
+
+    Uma única consulta: saldos do livro por subconsulta indexada e despesas pagas por subconsulta agrupada.
+    """
+    despesas_pagas = db.session.query(
+        Despesa.pago_por_id.label('usuario_id'),
+        db.func.sum(Despesa.valor_total).label('total')
+    )
+    if data is not None:
+        despesas_pagas = despesas_pagas.filter(Despesa.data_vencimento <= data)
+    despesas_pagas = despesas_pagas.group_by(Despesa.pago_por_id).subquery()
+
+    linhas = db.session.query(
+        Usuario,
+        _saldo_fluxo(Usuario.id, data).correlate(Usuario).scalar_subquery(),
+        despesas_pagas.c.total,
+        _saldo_fluxo(None, data).scalar_subquery()
+    ).outerjoin(
+        despesas_pagas, despesas_pagas.c.usuario_id == Usuario.id
+    ).filter(
+        Usuario.tipo == 'investidor',
+        Usuario.ativo == True  # noqa: E712
+    ).order_by(Usuario.id).all()
+
+    return [
+        {
+            'usuario': usuario,
+            'total_aportes': total_aportes or 0,
+            'total_despesas_pagas': total_despesas_pagas or 0,
+            'total_despesas_divididas': -(fluxo_comum or 0),
+            'saldo': (total_aportes or 0) + (fluxo_comum or 0)
+        }
+        for usuario, total_aportes, total_despesas_pagas, fluxo_comum in linhas
+    ]
+
+
+def reconstruir_lancamentos_saldo():
+    """Recria lancamentos_saldo a partir dos aportes e das despesas pagas"""
+    lancamentos = []
+
+    aportes = db.session.execute(
+        select(Aporte.id, Aporte.usuario_id, Aporte.data, Aporte.valor)
+        .order_by(Aporte.usuario_id, Aporte.data, Aporte.id)
+    ).all()
+    for id, usuario_id, data, valor in aportes:
+        lancamentos.append((usuario_id, _data(data), valor, 'aporte', id))
+
+    despesas = db.session.execute(
+        select(Despesa.id, Despesa.data_vencimento, Despesa.valor_dividido)
+        .where(Despesa.status == 'pago', Despesa.valor_dividido != None)  # noqa: E711
+        .order_by(Despesa.data_vencimento, Despesa.id)
+    ).all()
+    for id, data_vencimento, valor_dividido in despesas:
+        lancamentos.append((None, _data(data_vencimento), -valor_dividido, 'despesa', id))
+
+    saldos = {}
+    linhas = []
+    for usuario_id, data, valor, origem, referencia_id in lancamentos:
+        saldos[usuario_id] = saldos.get(usuario_id, 0) + valor
+        linhas.append({
+            'usuario_id': usuario_id,
+            'data': data,
+            'valor': valor,
+            'saldo_acumulado': saldos[usuario_id],
+            'origem': origem,
+            'referencia_id': referencia_id,
+            'data_criacao': datetime.utcnow()
+        })
+
+    db.session.execute(LancamentoSaldo.__table__.delete())
+    if linhas:
+        db.session.execute(LancamentoSaldo.__table__.insert(), linhas)
+    db.session.commit()
+
+    return len(linhas)
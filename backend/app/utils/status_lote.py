@@ -0,0 +1,43 @@
+from sqlalchemy import select
+from app import db
+from app.models.despesa import Despesa
+from app.utils.alteracoes import Alteracao, CAMPOS_MONITORADOS, notificar_alteracoes
+from app.utils.versoes import registrar_alteracao
+
+# Limite de parâmetros por IN (...) para respeitar o máximo de variáveis do SQLite
+TAMANHO_LOTE = 500
+
+
+def atualizar_status_em_lote(filtros, status):
+    """Muda o status das despesas que atendem aos filtros com UPDATE em conjunto
+
+    As tabelas derivadas e a versão de despesas são atualizadas uma vez para todo o lote.
+    Retorna os ids alterados.
+    """
+    campos = CAMPOS_MONITORADOS[Despesa]
+    colunas = [getattr(Despesa, campo) for campo in campos]
+    conexao = db.session.connection()
+
+    linhas = conexao.execute(
+        select(Despesa.id, *colunas).where(*filtros, Despesa.status != status)
+    ).all()
+    if not linhas:
+        return []
+
+    ids = [linha[0] for linha in linhas]
+    tabela = Despesa.__table__
+    for inicio in range(0, len(ids), TAMANHO_LOTE):
+        conexao.execute(
+            tabela.update().where(tabela.c.id.in_(ids[inicio:inicio + TAMANHO_LOTE])).values(status=status)
+        )
+
+    alteracoes = []
+    for linha in linhas:
+        anterior = dict(zip(campos, linha[1:]))
+        alteracoes.append(Alteracao(Despesa, linha[0], anterior, dict(anterior, status=status)))
+    notificar_alteracoes(conexao, alteracoes)
+    registrar_alteracao(conexao, 'despesas')
+
+    # Objetos já carregados na sessão não refletem o UPDATE feito fora do ORM
+    db.session.expire_all()
+    return ids
@@ -0,0 +1,188 @@
+from collections import defaultdict
+from app import db
+from app.models.despesa import Despesa
+from app.models.aporte import Aporte
+from app.models.total_mensal import TotalMensal
+from app.utils.alteracoes import observar_alteracoes
+
+
+def _contribuicao(modelo, valores):
+    """Converte os valores de uma despesa/aporte em (chave, total, total_dividido)"""
+    if modelo is Despesa:
+        if not valores['data_vencimento']:
+            return None
+        chave = (
+            'despesa',
+            valores['data_vencimento'].year,
+            valores['data_vencimento'].month,
+            valores['categoria_id'],
+            valores['status'],
+            valores['pago_por_id']
+        )
+        return chave, valores['valor_total'] or 0, valores['valor_dividido'] or 0
+
+    if not valores['data']:
+        return None
+    chave = ('aporte', valores['data'].year, valores['data'].month, None, None, valores['usuario_id'])
+    return chave, valores['valor'] or 0, 0
+
+
+def _acumular(deltas, contribuicao, sinal):
+    if contribuicao is None:
+        return
+    chave, total, total_dividido = contribuicao
+    delta = deltas[chave]
+    delta[0] += sinal * total
+    delta[1] += sinal * total_dividido
+    delta[2] += sinal
+
+
+def _filtro_chave(chave):
+    origem, ano, mes, categoria_id, status, usuario_id = chave
+    tabela = TotalMensal.__table__
+    return [
+        tabela.c.origem == origem,
+        tabela.c.ano == ano,
+        tabela.c.mes == mes,
+        tabela.c.categoria_id == categoria_id,
+        tabela.c.status == status,
+        tabela.c.usuario_id == usuario_id
+    ]
+
+
+def aplicar_deltas(conexao, deltas):
+    """Soma os deltas {chave: [total, total_dividido, quantidade]} às linhas de totais_mensais"""
+    tabela = TotalMensal.__table__
+
+    for chave, (total, total_dividido, quantidade) in deltas.items():
+        if not total and not total_dividido and not quantidade:
+            continue
+
+        resultado = conexao.execute(
+            tabela.update().where(*_filtro_chave(chave)).values(
+                total=tabela.c.total + total,
+                total_dividido=tabela.c.total_dividido + total_dividido,
+                quantidade=tabela.c.quantidade + quantidade
+            )
+        )
+
+        if resultado.rowcount == 0:
+            origem, ano, mes, categoria_id, status, usuario_id = chave
+            conexao.execute(tabela.insert().values(
+                origem=origem,
+                ano=ano,
+                mes=mes,
+                categoria_id=categoria_id,
+                status=status,
+                usuario_id=usuario_id,
+                total=total,
+                total_dividido=total_dividido,
+                quantidade=quantidade
+            ))
+        elif quantidade < 0:
+            # Remover linhas que ficaram sem lançamentos
+            conexao.execute(
+                tabela.delete().where(*_filtro_chave(chave), tabela.c.quantidade <= 0)
+            )
+
+
+@observar_alteracoes
+def _atualizar_totais_mensais(conexao, alteracoes):
+    """Aplica em totais_mensais a diferença entre o estado anterior e o novo de cada registro"""
+    deltas = defaultdict(lambda: [0.0, 0.0, 0])
+
+    for alteracao in alteracoes:
+        if alteracao.anterior is not None:
+            _acumular(deltas, _contribuicao(alteracao.modelo, alteracao.anterior), -1)
+        if alteracao.atual is not None:
+            _acumular(deltas, _contribuicao(alteracao.modelo, alteracao.atual), 1)
+
+    if deltas:
+        aplicar_deltas(conexao, deltas)
+
+
+def _totais_calculados():
+    """Agrega despesas e aportes diretamente das tabelas de origem"""
+    ano_vencimento = db.extract('year', Despesa.data_vencimento)
+    mes_vencimento = db.extract('month', Despesa.data_vencimento)
+    despesas = db.session.query(
+        ano_vencimento,
+        mes_vencimento,
+        Despesa.categoria_id,
+        Despesa.status,
+        Despesa.pago_por_id,
+        db.func.sum(Despesa.valor_total),
+        db.func.coalesce(db.func.sum(Despesa.valor_dividido), 0),
+        db.func.count(Despesa.id)
+    ).group_by(
+        ano_vencimento, mes_vencimento, Despesa.categoria_id, Despesa.status, Despesa.pago_por_id
+    ).all()
+
+    ano_aporte = db.extract('year', Aporte.data)
+    mes_aporte = db.extract('month', Aporte.data)
+    aportes = db.session.query(
+        ano_aporte,
+        mes_aporte,
+        Aporte.usuario_id,
+        db.func.sum(Aporte.valor),
+        db.func.count(Aporte.id)
+    ).group_by(ano_aporte, mes_aporte, Aporte.usuario_id).all()
+
+    totais = {}
+    for ano, mes, categoria_id, status, usuario_id, total, total_dividido, quantidade in despesas:
+        totais[('despesa', int(ano), int(mes), categoria_id, status, usuario_id)] = (
+            total or 0, total_dividido or 0, quantidade
+        )
+    for ano, mes, usuario_id, total, quantidade in aportes:
+        totais[('aporte', int(ano), int(mes), None, None, usuario_id)] = (total or 0, 0, quantidade)
+
+    return totais
+
+
+def reconstruir_totais_mensais():
+    """Recalcula totais_mensais do zero a partir de despesas e aportes"""
+    totais = _totais_calculados()
+
+    db.session.execute(TotalMensal.__table__.delete())
+    if totais:
+        db.session.execute(TotalMensal.__table__.insert(), [
+            {
+                'origem': origem,
+                'ano': ano,
+                'mes': mes,
+                'categoria_id': categoria_id,
+                'status': status,
+                'usuario_id': usuario_id,
+                'total': total,
+                'total_dividido': total_dividido,
+                'quantidade': quantidade
+            }
+            for (origem, ano, mes, categoria_id, status, usuario_id), (total, total_dividido, quantidade)
+            in totais.items()
+        ])
+    db.session.commit()
+
+    return len(totais)
+
+
+def verificar_totais_mensais(tolerancia=0.005):
+    """Compara totais_mensais com os dados de origem e retorna as divergências encontradas"""
+    esperados = _totais_calculados()
+
+    armazenados = {}
+    for linha in TotalMensal.query.all():
+        chave = (linha.origem, linha.ano, linha.mes, linha.categoria_id, linha.status, linha.usuario_id)
+        armazenados[chave] = (linha.total, linha.total_dividido, linha.quantidade)
+
+    divergencias = []
+    for chave in set(esperados) | set(armazenados):
+        esperado = esperados.get(chave, (0, 0, 0))
+        armazenado = armazenados.get(chave, (0, 0, 0))
+        if (
+            abs(esperado[0] - armazenado[0]) > tolerancia
+            or abs(esperado[1] - armazenado[1]) > tolerancia
+            or esperado[2] != armazenado[2]
+        ):
+            divergencias.append({'chave': chave, 'esperado': esperado, 'armazenado': armazenado})
+
+    return divergencias
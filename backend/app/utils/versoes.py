@@ -0,0 +1,56 @@
+from flask import g, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app import db
+from app.models.versao_tabela import VersaoTabela
+
+# As versões ficam no banco para que todos os workers enxerguem as mesmas escritas
+
+
+def registrar_alteracao(conexao, *tabelas):
+    """Incrementa a versão de cada tabela informada na transação da conexão"""
+    tabela_versoes = VersaoTabela.__table__
+
+    for tabela in sorted(set(tabelas)):
+        resultado = conexao.execute(
+            tabela_versoes.update().where(tabela_versoes.c.tabela == tabela).values(
+                versao=tabela_versoes.c.versao + 1
+            )
+        )
+        if resultado.rowcount == 0:
+            conexao.execute(tabela_versoes.insert().values(tabela=tabela, versao=1))
+
+    if has_app_context():
+        g.pop('versoes_tabelas', None)
+
+
+@event.listens_for(Session, 'after_flush')
+def _registrar_tabelas_alteradas(session, flush_context):
+    """Incrementa a versão das tabelas que tiveram registros incluídos, alterados ou excluídos"""
+    tabelas = set()
+
+    for obj in session.new | session.deleted:
+        tabelas.add(obj.__table__.name)
+    for obj in session.dirty:
+        if session.is_modified(obj, include_collections=False):
+            tabelas.add(obj.__table__.name)
+
+    if tabelas:
+        registrar_alteracao(session.connection(), *tabelas)
+
+
+def versoes_atuais():
+    """Versão de cada tabela, lida uma única vez por requisição"""
+    if has_app_context() and 'versoes_tabelas' in g:
+        return g.versoes_tabelas
+
+    versoes = dict(db.session.query(VersaoTabela.tabela, VersaoTabela.versao).all())
+    if has_app_context():
+        g.versoes_tabelas = versoes
+    return versoes
+
+
+def versao_de(*tabelas):
+    """Tupla com as versões das tabelas informadas"""
+    versoes = versoes_atuais()
+    return tuple(versoes.get(tabela, 0) for tabela in tabelas)
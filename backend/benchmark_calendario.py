@@ -0,0 +1,64 @@
+"""Compara o cálculo direto de ciclos de fatura com o calendário em cache
+
+Uso: python benchmark_calendario.py [cartoes] [anos]
+"""
+import random
+import sys
+import time
+from datetime import date, timedelta
+from app.utils.calendario_faturas import calendario, mes_fechamento, vencimento_fatura, intervalo_fatura
+
+
+def _cartoes(quantidade):
+    aleatorio = random.Random(42)
+    return [(aleatorio.randint(1, 31), aleatorio.randint(1, 31)) for _ in range(quantidade)]
+
+
+def _datas(anos):
+    inicio = date(2015, 1, 1)
+    aleatorio = random.Random(7)
+    return [inicio + timedelta(days=aleatorio.randrange(anos * 365)) for _ in range(2000)]
+
+
+def calculo_direto(cartoes, datas):
+    resultado = []
+    for dia_fechamento, dia_vencimento in cartoes:
+        for data in datas:
+            ano, mes = mes_fechamento(dia_fechamento, data)
+            resultado.append((
+                intervalo_fatura(dia_fechamento, ano, mes),
+                vencimento_fatura(dia_fechamento, dia_vencimento, ano, mes)
+            ))
+    return resultado
+
+
+def calculo_em_cache(cartoes, datas):
+    resultado = []
+    for dia_fechamento, dia_vencimento in cartoes:
+        calendario_cartao = calendario(dia_fechamento, dia_vencimento)
+        for data in datas:
+            ciclo = calendario_cartao.ciclo_da_data(data)
+            resultado.append(((ciclo.inicio, ciclo.fechamento), ciclo.vencimento))
+    return resultado
+
+
+def medir(nome, funcao, *args):
+    inicio = time.perf_counter()
+    resultado = funcao(*args)
+    print(f"{nome}: {time.perf_counter() - inicio:.3f}s ({len(resultado)} consultas)")
+    return resultado
+
+
+if __name__ == '__main__':
+    quantidade_cartoes = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    anos = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    cartoes = _cartoes(quantidade_cartoes)
+    datas = _datas(anos)
+
+    direto = medir('Cálculo direto', calculo_direto, cartoes, datas)
+    medir('Calendário (primeira execução, montando o cache)', calculo_em_cache, cartoes, datas)
+    em_cache = medir('Calendário (cache aquecido)', calculo_em_cache, cartoes, datas)
+
+    assert direto == em_cache, 'Calendário diverge do cálculo direto'
+    print(f"Resultados idênticos; {calendario.cache_info()}")
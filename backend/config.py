@@ -11,6 +11,8 @@ SECRET_KEY = os.getenv("JWT_SECRET_KEY", "uma-chave-secreta-padrao-muito-forte")
 SQLALCHEMY_DATABASE_URI = os.getenv("DATABASE_URL", "sqlite:///app.db")
 SQLALCHEMY_TRACK_MODIFICATIONS = False
 JWT_SECRET_KEY = SECRET_KEY # Garante que JWT use a mesma chave
+CARREGAMENTO_ESTRITO = os.getenv("CARREGAMENTO_ESTRITO") == "1" # Lazy loads inesperados levantam erro
+LIMITE_CARTAO_POLITICA = os.getenv("LIMITE_CARTAO_POLITICA", "avisar") # ignorar, avisar ou bloquear
 
 # Outras configurações que possa precisar...
 # DEBUG = os.getenv("FLASK_ENV") == "development"
@@ -6,6 +6,13 @@ from dotenv import load_dotenv
 from app import db, jwt
 from app.models import *
 from app.routes import *
+from app.utils.totais_mensais import reconstruir_totais_mensais, verificar_totais_mensais
+from app.utils.saldos import reconstruir_lancamentos_saldo
+from app.utils.migracoes import aplicar_migracoes
+from app.utils.busca import reconstruir_busca
+from app.utils.faturas import fechar_faturas
+from app.utils.limites_cartoes import reconstruir_saldos_cartoes
+from app.utils.revogacao import limpar_tokens_expirados
 
 # Carrega variáveis do .env
 load_dotenv()
@@ -26,6 +33,11 @@ if not jwt_key:
 app.config['JWT_SECRET_KEY'] = jwt_key
 app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=24)
 
+# Em testes/desenvolvimento, CARREGAMENTO_ESTRITO=1 faz lazy loads inesperados levantarem erro
+app.config['CARREGAMENTO_ESTRITO'] = os.environ.get('CARREGAMENTO_ESTRITO') == '1'
+# Despesa que passa do limite do cartão: ignorar, avisar (padrão) ou bloquear
+app.config['LIMITE_CARTAO_POLITICA'] = os.environ.get('LIMITE_CARTAO_POLITICA', 'avisar')
+
 # Inicializar extensões
 db.init_app(app)
 jwt.init_app(app)
@@ -46,6 +58,7 @@ app.register_blueprint(despesas_bp, url_prefix='/api/despesas')
 app.register_blueprint(aportes_bp, url_prefix='/api/aportes')
 app.register_blueprint(cartoes_bp, url_prefix='/api/cartoes')
 app.register_blueprint(dashboard_bp, url_prefix='/api/dashboard')
+app.register_blueprint(busca_bp, url_prefix='/api/busca')
 
 @app.route('/api/status')
 def status():
@@ -55,7 +68,61 @@ def status():
         'version': '1.0.0'
     })
 
+@app.cli.command('reconstruir-totais')
+def reconstruir_totais():
+    """Recalcula a tabela totais_mensais a partir de despesas e aportes"""
+    linhas = reconstruir_totais_mensais()
+    print(f"totais_mensais reconstruída com {linhas} linhas.")
+
+@app.cli.command('verificar-totais')
+def verificar_totais():
+    """Compara totais_mensais com os dados de origem e lista as divergências"""
+    divergencias = verificar_totais_mensais()
+    for divergencia in divergencias:
+        print(f"{divergencia['chave']}: esperado {divergencia['esperado']}, armazenado {divergencia['armazenado']}")
+    print(f"{len(divergencias)} divergência(s) encontrada(s).")
+    if divergencias:
+        raise SystemExit(1)
+
+@app.cli.command('reconstruir-saldos')
+def reconstruir_saldos():
+    """Recria o livro de saldos dos investidores a partir de aportes e despesas pagas"""
+    lancamentos = reconstruir_lancamentos_saldo()
+    print(f"lancamentos_saldo reconstruída com {lancamentos} lançamentos.")
+
+@app.cli.command('migrar')
+def migrar():
+    """Cria tabelas e índices que faltam em bancos já existentes"""
+    criados = aplicar_migracoes()
+    for indice in criados:
+        print(f"Índice criado: {indice}")
+    print(f"{len(criados)} índice(s) criado(s).")
+
+@app.cli.command('reconstruir-busca')
+def reconstruir_indice_busca():
+    """Recria o índice textual de despesas e aportes"""
+    indexados = reconstruir_busca()
+    print(f"Índice de busca reconstruído com {indexados} registros.")
+
+@app.cli.command('reconstruir-limites')
+def reconstruir_limites():
+    """Recalcula o saldo em aberto de cada cartão a partir das despesas não pagas"""
+    cartoes = reconstruir_saldos_cartoes()
+    print(f"saldos_cartoes reconstruída com {cartoes} cartões.")
+
+@app.cli.command('limpar-tokens')
+def limpar_tokens():
+    """Remove da lista de revogação os tokens que já expiraram"""
+    removidos = limpar_tokens_expirados()
+    print(f"{removidos} token(s) revogado(s) expirado(s) removido(s).")
+
+@app.cli.command('fechar-faturas')
+def fechar_faturas_cartoes():
+    """Grava as faturas dos ciclos de cartão já fechados que ainda não foram registradas"""
+    criadas = fechar_faturas()
+    print(f"{criadas} fatura(s) fechada(s).")
+
 if __name__ == '__main__':
     with app.app_context():
-        db.create_all()
+        aplicar_migracoes()
     app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 5000)))
@@ -0,0 +1,39 @@
+import os
+import tempfile
+import pytest
+
+# main lê DATABASE_URL ao ser importado: o banco de teste precisa ser definido antes
+_banco = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+_banco.close()
+os.environ['DATABASE_URL'] = f'sqlite:///{_banco.name}'
+
+import main
+from app import db
+from app.utils.db_init import inicializar_banco
+
+
+def login(cliente, email, senha):
+    resposta = cliente.post('/api/auth/login', json={'email': email, 'senha': senha})
+    return {'Authorization': f"Bearer {resposta.get_json()['token']}"}
+
+
+@pytest.fixture(scope='session')
+def app():
+    aplicacao = main.app
+    with aplicacao.app_context():
+        db.create_all()
+        inicializar_banco()
+        yield aplicacao
+        db.session.remove()
+        db.drop_all()
+    os.remove(_banco.name)
+
+
+@pytest.fixture(scope='session')
+def cliente(app):
+    return app.test_client()
+
+
+@pytest.fixture(scope='session')
+def cabecalhos(cliente):
+    return login(cliente, 'fellype@controle-financeiro.com', 'Admin@2025')
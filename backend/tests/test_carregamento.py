@@ -0,0 +1,83 @@
+from datetime import date
+import pytest
+from app import db
+from app.models.cartao import Cartao
+from app.models.categoria import Categoria
+from app.models.despesa import Despesa
+from app.models.usuario import Usuario
+from app.utils.cache import cache_respostas
+from app.utils.calendario_faturas import calendario_cartao, somar_meses
+from app.utils.faturas import fechar_faturas
+
+
+@pytest.fixture
+def carregamento_estrito(app):
+    """Lazy loads fora das opções de serialização levantam erro durante o teste"""
+    app.config['CARREGAMENTO_ESTRITO'] = True
+    cache_respostas.limpar()
+    yield
+    app.config['CARREGAMENTO_ESTRITO'] = False
+
+
+@pytest.fixture(scope='module')
+def cartao_com_despesas(app):
+    admin = Usuario.query.filter_by(tipo='admin').first()
+    categoria = Categoria.query.first()
+    cartao = Cartao(nome='Estrito', limite=5000, dia_fechamento=10, dia_vencimento=20, usuario_id=admin.id)
+    db.session.add(cartao)
+    db.session.commit()
+
+    hoje = date.today()
+    ciclo_aberto = calendario_cartao(cartao).ciclo_da_data(hoje)
+    ano_fechado, mes_fechado = somar_meses(ciclo_aberto.ano, ciclo_aberto.mes, -1)
+    ciclo_fechado = calendario_cartao(cartao).ciclo(ano_fechado, mes_fechado)
+
+    for indice, ciclo in enumerate([ciclo_fechado, ciclo_aberto]):
+        db.session.add(Despesa(
+            descricao=f'Compra estrita {indice}',
+            categoria_id=categoria.id,
+            valor_total=100.0,
+            valor_dividido=25.0,
+            data_compra=ciclo.fechamento,
+            data_vencimento=ciclo.vencimento,
+            forma_pagamento='Cartão',
+            cartao_id=cartao.id,
+            pago_por_id=admin.id,
+            status='pendente',
+            tipo_despesa='única'
+        ))
+    db.session.commit()
+    cartao_id = cartao.id
+    fechar_faturas(hoje)
+    # Nada carregado aqui pode mascarar um lazy load nas rotas
+    db.session.expunge_all()
+    return cartao_id, ciclo_fechado, ciclo_aberto
+
+
+def test_listar_despesas_sem_lazy_load(cliente, cabecalhos, carregamento_estrito, cartao_com_despesas):
+    resposta = cliente.get('/api/despesas/', headers=cabecalhos)
+
+    assert resposta.status_code == 200
+    assert resposta.get_json()
+
+
+def test_fatura_cartao_sem_lazy_load(cliente, cabecalhos, carregamento_estrito, cartao_com_despesas):
+    cartao_id, ciclo_fechado, ciclo_aberto = cartao_com_despesas
+
+    # A rota avança um mês quando o fechamento do mês corrente já passou
+    hoje = date.today()
+    avanco = 1 if ciclo_aberto.ano * 12 + ciclo_aberto.mes > hoje.year * 12 + hoje.month else 0
+
+    # Ciclo fechado vem da fotografia em faturas; o aberto é calculado na hora
+    for ciclo in (ciclo_fechado, ciclo_aberto):
+        ano, mes = somar_meses(ciclo.ano, ciclo.mes, -avanco)
+        resposta = cliente.get(f'/api/cartoes/{cartao_id}/faturas?mes={mes}&ano={ano}', headers=cabecalhos)
+        assert resposta.status_code == 200
+        assert [despesa['descricao'] for despesa in resposta.get_json()['despesas']]
+
+
+def test_resumo_dashboard_sem_lazy_load(cliente, cabecalhos, carregamento_estrito, cartao_com_despesas):
+    resposta = cliente.get('/api/dashboard/resumo', headers=cabecalhos)
+
+    assert resposta.status_code == 200
+    assert 'proximos_vencimentos' in resposta.get_json()
@@ -0,0 +1,111 @@
+import io
+from app.models.despesa import Despesa
+from app.models.usuario import Usuario
+from app.utils.importacao import ler_csv, ler_ofx
+from conftest import login
+
+CSV = (
+    '﻿descricao;valor_total;data_compra;categoria;status\r\n'
+    '"Pão\nde queijo";1.234,50;05/03/2026;Alimentação;pago\r\n'
+    'Café;12,00;2026-03-06;Alimentação;pendente\r\n'
+    'Sem valor;;2026-03-06;Alimentação;pendente\r\n'
+)
+
+OFX = (
+    'OFXHEADER:100\r\n'
+    '<OFX><BANKTRANLIST>\r\n'
+    '<STMTTRN><TRNTYPE>DEBIT<DTPOSTED>20260310120000<TRNAMT>-50.25<NAME>Padaria<MEMO>Pão francês\r\n'
+    '</STMTTRN>\r\n'
+    '<STMTTRN><TRNTYPE>CREDIT<DTPOSTED>20260311<TRNAMT>100.00<NAME>Estorno\r\n'
+    '</STMTTRN>\r\n'
+    '</BANKTRANLIST></OFX>\r\n'
+)
+
+
+class StreamSemReadable:
+    """Imita o SpooledTemporaryFile do Python 3.9/3.10, que não tem readable() e quebra io.TextIOWrapper"""
+
+    def __init__(self, conteudo):
+        self._arquivo = io.BytesIO(conteudo)
+
+    def read(self, *args):
+        return self._arquivo.read(*args)
+
+    def readline(self, *args):
+        return self._arquivo.readline(*args)
+
+    def __iter__(self):
+        return iter(self._arquivo)
+
+
+def test_ler_csv_sem_readable():
+    registros = list(ler_csv(StreamSemReadable(CSV.encode('utf-8'))))
+    assert [numero for numero, _ in registros] == [3, 4, 5]
+    assert registros[0][1]['descricao'] == 'Pão\nde queijo'
+    assert registros[1][1]['valor_total'] == '12,00'
+
+
+def test_ler_ofx_sem_readable():
+    registros = list(ler_ofx(StreamSemReadable(OFX.encode('latin-1'))))
+    assert registros[0] == (1, {
+        'descricao': 'Pão francês',
+        'origem': 'Padaria',
+        'valor_total': '-50.25',
+        'data_compra': '20260310',
+        'credito': False
+    })
+    assert registros[1][1]['credito'] is True
+
+
+def test_importar_csv_multipart(cliente, cabecalhos):
+    antes = Despesa.query.count()
+    resposta = cliente.post(
+        '/api/despesas/importar',
+        headers=cabecalhos,
+        data={'arquivo': (io.BytesIO(CSV.encode('utf-8')), 'despesas.csv')},
+        content_type='multipart/form-data'
+    )
+
+    assert resposta.status_code == 201
+    relatorio = resposta.get_json()
+    assert relatorio['importadas'] == 2
+    assert relatorio['erros'] == [{'linha': 5, 'erro': "Campo 'valor_total' é obrigatório"}]
+    assert Despesa.query.count() == antes + 2
+    assert Despesa.query.filter_by(descricao='Pão\nde queijo').one().valor_total == 1234.5
+
+
+def test_importar_ofx_multipart(cliente, cabecalhos):
+    resposta = cliente.post(
+        '/api/despesas/importar',
+        headers=cabecalhos,
+        data={'arquivo': (io.BytesIO(OFX.encode('latin-1')), 'extrato.ofx'), 'categoria_id': '1'},
+        content_type='multipart/form-data'
+    )
+
+    assert resposta.status_code == 201
+    relatorio = resposta.get_json()
+    assert relatorio['importadas'] == 1
+    assert relatorio['erros'] == [{'linha': 2, 'erro': 'Lançamento de crédito ignorado'}]
+    assert Despesa.query.filter_by(descricao='Pão francês').one().valor_total == 50.25
+
+
+def test_pago_por_so_vale_para_admin(cliente, cabecalhos):
+    csv_pagador = (
+        'descricao,valor_total,data_compra,categoria,pago_por\n'
+        'Mercado {quem},10,2026-03-07,Alimentação,carneiro@controle-financeiro.com\n'
+    )
+    carneiro = Usuario.query.filter_by(email='carneiro@controle-financeiro.com').one()
+    rafael = Usuario.query.filter_by(email='rafael@controle-financeiro.com').one()
+    investidor = login(cliente, 'rafael@controle-financeiro.com', 'Invest2@2025')
+
+    for quem, headers in (('admin', cabecalhos), ('investidor', investidor)):
+        resposta = cliente.post(
+            '/api/despesas/importar',
+            headers=headers,
+            data={'arquivo': (io.BytesIO(csv_pagador.format(quem=quem).encode('utf-8')), 'despesas.csv')},
+            content_type='multipart/form-data'
+        )
+        assert resposta.status_code == 201
+
+    assert Despesa.query.filter_by(descricao='Mercado admin').one().pago_por_id == carneiro.id
+    assert Despesa.query.filter_by(descricao='Mercado investidor').one().pago_por_id == rafael.id